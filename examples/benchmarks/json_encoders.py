@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016-2019 CERN.
+#
+# Invenio is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Benchmark of the JSON encoders of the deposit serializers.
+
+Encode a deposit with many files with each encoder available for
+:data:`invenio_deposit.config.DEPOSIT_JSON_ENCODER`:
+
+.. code-block:: console
+
+   $ pip install orjson ujson
+   $ python examples/benchmarks/json_encoders.py --files 3000
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import json
+import timeit
+import uuid
+
+from invenio_deposit.serializers import orjson_dumps, ujson_dumps
+
+
+def deposit_data(files):
+    """Build the JSON of a deposit.
+
+    :param files: The number of files of the deposit.
+    :returns: The deposit data.
+    """
+    return {
+        '_deposit': {'id': '1', 'status': 'draft', 'owners': [1]},
+        'title': 'Title',
+        '_files': [{
+            'key': 'file-{0}.txt'.format(i),
+            'size': i,
+            'checksum': 'md5:{0:032x}'.format(i),
+            'bucket': str(uuid.uuid4()),
+            'version_id': str(uuid.uuid4()),
+        } for i in range(files)],
+    }
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=3000,
+                        help='number of files of the deposit')
+    parser.add_argument('--number', type=int, default=200,
+                        help='number of encodings of each encoder')
+    args = parser.parse_args()
+
+    data = deposit_data(args.files)
+    size = len(json.dumps(data))
+    print('{0} files, {1} kB of JSON'.format(args.files, size // 1000))
+    for name, encoder in [('json', json.dumps), ('ujson', ujson_dumps),
+                          ('orjson', orjson_dumps)]:
+        try:
+            encoder(data)
+        except ImportError:
+            print('{0:<7} not installed'.format(name))
+            continue
+        seconds = timeit.timeit(lambda: encoder(data), number=args.number)
+        print('{0:<7} {1:7.2f} ms/record {2:7.1f} MB/s'.format(
+            name, seconds / args.number * 1000,
+            size * args.number / seconds / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016-2019 CERN.
+#
+# Invenio is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Benchmark of the merge of an edited deposit with its published record.
+
+Merge a record with many authors and references, with one author changed on
+each side, with :func:`invenio_deposit.merge.merge` and with :mod:`dictdiffer`
+on the full documents:
+
+.. code-block:: console
+
+   $ python examples/benchmarks/merge.py --authors 3000 --references 5000
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import timeit
+from copy import deepcopy
+
+from dictdiffer import patch
+from dictdiffer.merge import Merger
+
+from invenio_deposit.merge import merge
+
+
+def record_versions(authors, references):
+    """Build the common ancestor and the two edited versions of a record.
+
+    :param authors: The number of authors of the record.
+    :param references: The number of references of the record.
+    :returns: A tuple with the common ancestor, the published record and the
+        deposit.
+    """
+    lca = {
+        'title': 'Title',
+        'authors': [{
+            'orcid': 'orcid-{0}'.format(i),
+            'name': 'Author {0}'.format(i),
+            'affiliations': [{'name': 'CERN'}],
+        } for i in range(authors)],
+        'references': ['reference-{0}'.format(i) for i in range(references)],
+    }
+    first = deepcopy(lca)
+    first['title'] = 'New title'
+    first['authors'][authors // 3]['name'] = 'First'
+    second = deepcopy(lca)
+    second['authors'][authors * 2 // 3]['name'] = 'Second'
+    second['keywords'] = ['keyword']
+    return lca, first, second
+
+
+def merge_dictdiffer(lca, first, second):
+    """Merge the full documents with :mod:`dictdiffer`.
+
+    :returns: The merged document.
+    """
+    merger = Merger(deepcopy(lca), deepcopy(first), deepcopy(second), {})
+    merger.run()
+    return patch(merger.unified_patches, lca)
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--authors', type=int, default=3000,
+                        help='number of authors of the record')
+    parser.add_argument('--references', type=int, default=5000,
+                        help='number of references of the record')
+    parser.add_argument('--number', type=int, default=5,
+                        help='number of merges of each implementation')
+    args = parser.parse_args()
+
+    lca, first, second = record_versions(args.authors, args.references)
+    list_keys = {'authors': 'orcid'}
+    assert merge(lca, first, second, list_keys) == \
+        merge_dictdiffer(lca, first, second)
+    for name, function in [
+            ('dictdiffer', lambda: merge_dictdiffer(lca, first, second)),
+            ('merge', lambda: merge(lca, first, second, list_keys))]:
+        seconds = timeit.timeit(function, number=args.number)
+        print('{0:<10} {1:8.1f} ms'.format(
+            name, seconds / args.number * 1000))
+
+
+if __name__ == '__main__':
+    main()
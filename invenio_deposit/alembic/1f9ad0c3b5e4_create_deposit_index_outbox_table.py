@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016-2019 CERN.
+#
+# Invenio is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Create deposit index outbox table."""
+
+import sqlalchemy as sa
+import sqlalchemy_utils
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '1f9ad0c3b5e4'
+down_revision = '6ea1b5e2a96f'
+branch_labels = ()
+depends_on = None
+
+
+def upgrade():
+    """Upgrade database."""
+    op.create_table(
+        'deposit_index_outbox',
+        sa.Column('created', sa.DateTime(), nullable=False),
+        sa.Column('updated', sa.DateTime(), nullable=False),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column(
+            'record_id',
+            sqlalchemy_utils.types.uuid.UUIDType(),
+            nullable=False
+        ),
+        sa.Column('index', sa.String(length=255), nullable=True),
+        sa.Column('doc_type', sa.String(length=255), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        op.f('ix_deposit_index_outbox_record_id'),
+        'deposit_index_outbox', ['record_id'], unique=False
+    )
+    op.create_index(
+        op.f('ix_deposit_index_outbox_next_attempt'),
+        'deposit_index_outbox', ['next_attempt'], unique=False
+    )
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_index(
+        op.f('ix_deposit_index_outbox_next_attempt'),
+        table_name='deposit_index_outbox'
+    )
+    op.drop_index(
+        op.f('ix_deposit_index_outbox_record_id'),
+        table_name='deposit_index_outbox'
+    )
+    op.drop_table('deposit_index_outbox')
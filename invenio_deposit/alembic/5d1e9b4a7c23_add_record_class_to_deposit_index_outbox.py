@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016-2019 CERN.
+#
+# Invenio is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Add record class to deposit index outbox."""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '5d1e9b4a7c23'
+down_revision = '8e2b5a7c0d14'
+branch_labels = ()
+depends_on = None
+
+
+def upgrade():
+    """Upgrade database."""
+    op.add_column(
+        'deposit_index_outbox',
+        sa.Column('record_class', sa.String(length=255), nullable=True)
+    )
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_column('deposit_index_outbox', 'record_class')
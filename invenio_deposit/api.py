@@ -8,31 +8,35 @@
 
 """Deposit API."""
 
+import hashlib
 import uuid
+from collections import OrderedDict
 from contextlib import contextmanager
 from copy import deepcopy
 from functools import partial, wraps
 
-from dictdiffer import patch
-from dictdiffer.merge import Merger, UnresolvedConflictsException
 from elasticsearch.exceptions import RequestError
 from flask import current_app
 from flask_login import current_user
 from invenio_db import db
-from invenio_files_rest.models import Bucket
-from invenio_indexer.api import RecordIndexer
+from invenio_files_rest.models import Bucket, ObjectVersion
 from invenio_pidstore import current_pidstore
 from invenio_pidstore.errors import PIDInvalidAction
 from invenio_pidstore.models import PersistentIdentifier, PIDStatus
 from invenio_pidstore.resolver import Resolver
 from invenio_records.signals import after_record_update, before_record_update
-from invenio_records_files.api import Record
+from invenio_records_files.api import FilesIterator, Record, _writable
 from invenio_records_files.models import RecordsBuckets
+from sqlalchemy import and_, func, inspect
+from sqlalchemy.orm import joinedload
 from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy_continuum import version_class
 from werkzeug.local import LocalProxy
 
-from .errors import MergeConflict
+from .cache import invalidate_responses
 from .fetchers import deposit_fetcher as default_deposit_fetcher
+from .indexer import DepositIndexer
+from .merge import merge
 from .minters import deposit_minter as default_deposit_minter
 from .utils import mark_as_action
 
@@ -40,6 +44,24 @@ current_jsonschemas = LocalProxy(
     lambda: current_app.extensions['invenio-jsonschemas']
 )
 
+_SUSPEND_INDEXING = 'invenio_deposit.suspend_indexing'
+"""Session info key set while the :func:`index` decorator is suspended."""
+
+
+@contextmanager
+def _suspend_indexing():
+    """Do not index deposits inside the context.
+
+    Used by bulk operations that index all the modified deposits at once.
+    """
+    info = db.session.info
+    suspended = info.get(_SUSPEND_INDEXING, False)
+    info[_SUSPEND_INDEXING] = True
+    try:
+        yield
+    finally:
+        info[_SUSPEND_INDEXING] = suspended
+
 
 def index(method=None, delete=False):
     """Decorator to update index.
@@ -54,6 +76,9 @@ def index(method=None, delete=False):
     def wrapper(self_or_cls, *args, **kwargs):
         """Send record for indexing."""
         result = method(self_or_cls, *args, **kwargs)
+        invalidate_responses(result.id)
+        if db.session.info.get(_SUSPEND_INDEXING):
+            return result
         try:
             if delete:
                 self_or_cls.indexer.delete(result)
@@ -65,6 +90,19 @@ def index(method=None, delete=False):
     return wrapper
 
 
+def diff_fields(old, new):
+    """Get the top-level fields which differ between two documents.
+
+    :param old: The old document.
+    :param new: The new document.
+    :returns: The set of the added, removed or changed fields.
+    """
+    return {
+        key for key in set(old) | set(new)
+        if key not in old or key not in new or old[key] != new[key]
+    }
+
+
 def has_status(method=None, status='draft'):
     """Check that deposit has a defined status (default: draft).
 
@@ -110,12 +148,117 @@ def preserve(method=None, result=True, fields=None):
     return wrapper
 
 
+class DepositFilesIterator(FilesIterator):
+    """Files iterator of a deposit.
+
+    Adding, renaming and deleting files does not read the whole bucket back
+    into the ``_files`` of the deposit: they are refreshed from the bucket when
+    the deposit is dumped or committed. Only the order set by :meth:`sort_by`
+    is stored in the deposit.
+    """
+
+    def _sorted_objects(self):
+        """Get the objects of the bucket, in the order of the files.
+
+        The file instances are loaded in the same query, as they are read to
+        serialize the files.
+
+        :returns: The list of head object versions of the bucket.
+        """
+        sortby = {key: position for position, key in enumerate(self.keys)}
+        objs = ObjectVersion.get_by_bucket(self.bucket).options(
+            joinedload(ObjectVersion.file)).all()
+        return sorted(objs, key=lambda obj: sortby.get(obj.key, len(sortby)))
+
+    _page = None
+
+    def page(self, size, after=None):
+        """Restrict the iteration to a page of the files, in key order.
+
+        Only the files of the page are loaded from the bucket: the pages list
+        the files by key, not in the order set by :meth:`sort_by`.
+
+        :param size: The number of files of the page.
+        :param after: The key of the last file of the previous page.
+            (Default: ``None``)
+        :returns: The key of the last file of the page, or ``None`` if it is
+            the last page.
+        """
+        query = ObjectVersion.get_by_bucket(self.bucket).options(
+            joinedload(ObjectVersion.file))
+        if after is not None:
+            query = query.filter(ObjectVersion.key > after)
+        objs = query.limit(size + 1).all()
+        self._page = objs[:size]
+        if len(objs) > size:
+            return self._page[-1].key
+        return None
+
+    def __iter__(self):
+        """Get iterator."""
+        self._it = iter(self._sorted_objects() if self._page is None
+                        else self._page)
+        return self
+
+    def flush(self):
+        """Do not update the deposit on each change of the files."""
+
+    @_writable
+    def rename(self, old_key, new_key):
+        """Rename a file.
+
+        The file may be missing from the stored ``_files``, e.g. if it was
+        uploaded by an earlier request: its entry is then built from the
+        bucket object.
+
+        :param old_key: Old key that holds the object.
+        :param new_key: New key that will hold the object.
+        :returns: The object that has been renamed.
+        """
+        assert new_key not in self
+        assert old_key != new_key
+
+        file_ = self[old_key]
+        old_data = dict(self.filesmap.get(old_key, {}))
+
+        obj = ObjectVersion.create(
+            bucket=self.bucket, key=new_key, _file_id=file_.obj.file_id)
+
+        self.filesmap[new_key] = self.file_cls(obj, old_data).dumps()
+        del self[old_key]
+
+        return obj
+
+    def sort_by(self, *ids):
+        """Update files order.
+
+        :param ids: List of ids specifying the final status of the list.
+        """
+        # Support sorting by file_ids or keys.
+        files = {}
+        for file_ in self:
+            files[str(file_.file_id)] = files[file_.key] = file_
+        self.filesmap = OrderedDict([
+            (files[id_].key, files[id_].dumps()) for id_ in ids
+        ])
+        self.record['_files'] = list(self.filesmap.values())
+
+
 class Deposit(Record):
     """Define API for changing deposit state."""
 
-    indexer = RecordIndexer()
+    indexer = DepositIndexer()
     """Default deposit indexer."""
 
+    changed_fields = None
+    """Top-level fields changed by the last write of the deposit, if known.
+
+    See :data:`invenio_deposit.config.DEPOSIT_PARTIAL_INDEXING_FIELDS`.
+    """
+
+    files_iter_cls = DepositFilesIterator
+    """Files iterator class used to generate the files iterator."""
+
     published_record_class = Record
     """The Record API class used for published records."""
 
@@ -156,39 +299,212 @@ class Deposit(Record):
             )
 
     def fetch_published(self):
-        """Return a tuple with PID and published record."""
+        """Return a tuple with PID and published record.
+
+        The result is kept on the deposit until the published record is
+        expired by a session commit: publishing stores the record it has just
+        created or updated, so that the
+        :data:`invenio_deposit.signals.post_action` receivers do not load it
+        again.
+        """
         pid_type = self['_deposit']['pid']['type']
         pid_value = self['_deposit']['pid']['value']
 
+        published = getattr(self, '_published', None)
+        if published is not None and published[0] == (pid_type, pid_value):
+            pid, record = published[1]
+            if not inspect(record.model).expired_attributes:
+                return pid, record
+
         resolver = Resolver(
             pid_type=pid_type, object_type='rec',
             getter=partial(self.published_record_class.get_record,
                            with_deleted=True)
         )
-        return resolver.resolve(pid_value)
+        return self._set_published(*resolver.resolve(pid_value))
+
+    def _set_published(self, pid, record):
+        """Keep the PID and the published record of the deposit.
+
+        :param pid: The PID of the published record.
+        :param record: The published record.
+        :returns: A tuple with PID and published record.
+        """
+        self._published = (
+            (self['_deposit']['pid']['type'],
+             self['_deposit']['pid']['value']),
+            (pid, record),
+        )
+        return self._published[1]
+
+    def _merge_base(self, record):
+        """Get the revision of the published record which was edited.
+
+        The revision is loaded by record and version identifiers from the
+        version table of the records, and kept in the merge bases cache (see
+        :data:`invenio_deposit.config.DEPOSIT_MERGE_BASE_CACHE_SIZE`).
+
+        :param record: The published record.
+        :returns: The data of the revision, which must not be modified.
+        """
+        revision_id = self['_deposit']['pid']['revision_id']
+        state = current_app.extensions.get('invenio-deposit-rest') or \
+            current_app.extensions['invenio-deposit']
+        data = state.merge_bases.get(record.id, revision_id)
+        if data is None:
+            version = version_class(record.model_cls)
+            data, = db.session.query(version.json).filter(
+                version.id == record.id,
+                # revision identifiers start from 0, versions from 1
+                version.version_id == revision_id + 1,
+            ).one()
+            state.merge_bases.set(record.id, revision_id, data)
+        return data
 
     @preserve(fields=('_deposit', '$schema'))
     def merge_with_published(self):
-        """Merge changes with latest published version."""
+        """Merge changes with latest published version.
+
+        See :func:`invenio_deposit.merge.merge` and
+        :data:`invenio_deposit.config.DEPOSIT_MERGE_LIST_KEYS`.
+        """
         pid, first = self.fetch_published()
-        lca = first.revisions[self['_deposit']['pid']['revision_id']]
+        lca = self._merge_base(first)
         # ignore _deposit and $schema field
-        args = [lca.dumps(), first.dumps(), self.dumps()]
-        for arg in args:
-            del arg['$schema'], arg['_deposit']
-        args.append({})
-        m = Merger(*args)
-        try:
-            m.run()
-        except UnresolvedConflictsException:
-            raise MergeConflict()
-        return patch(m.unified_patches, lca)
+        args = [
+            {key: value for key, value in data.items()
+             if key not in ('$schema', '_deposit')}
+            for data in (lca, first, self._refresh_files(dict(self)))
+        ]
+        return merge(*args, list_keys=current_app.config[
+            'DEPOSIT_MERGE_LIST_KEYS'])
+
+    def _bucket_files(self):
+        """Serialize the files of an unlocked deposit bucket.
+
+        The files keep the order and the extra metadata of ``_files``, matched
+        by file id or, for the replaced ones, by key. New files follow in
+        upload order.
+
+        :returns: The list of serialized files, or ``None`` if the deposit has
+            no bucket or if it is locked, as its files can not change.
+        """
+        if self.model is None or getattr(self, '_files_locked', False):
+            return None
+        rows = db.session.query(Bucket, ObjectVersion).join(
+            RecordsBuckets, RecordsBuckets.bucket_id == Bucket.id
+        ).outerjoin(ObjectVersion, and_(
+            ObjectVersion.bucket_id == Bucket.id,
+            ObjectVersion.is_head.is_(True),
+            ObjectVersion.file_id.isnot(None),
+        )).filter(
+            RecordsBuckets.record_id == self.id
+        ).options(
+            joinedload(ObjectVersion.file)
+        ).order_by(ObjectVersion.key).all()
+        if not rows:
+            return None
+        if rows[0][0].locked:
+            # A bucket is never unlocked: do not look at it again.
+            self._files_locked = True
+            return None
+
+        by_file_id, by_key = {}, {}
+        stored = self.get('_files', [])
+        for position, data in enumerate(stored):
+            by_file_id.setdefault(data.get('file_id'), (position, data))
+            by_key.setdefault(data.get('key'), (position, data))
+        files = []
+        for _, obj in rows:
+            if obj is None:
+                continue
+            position, data = by_file_id.get(str(obj.file_id)) or \
+                by_key.get(obj.key) or (len(stored), {})
+            files.append((position, obj.created, obj.key, self.file_cls(
+                obj, deepcopy(data)).dumps()))
+        return [data for _, _, _, data in sorted(files, key=lambda f: f[:3])]
+
+    def _refresh_files(self, data):
+        """Refresh the ``_files`` of a deposit dump from its bucket.
+
+        Files can be uploaded, renamed or deleted without committing the
+        deposit, so the stored ``_files`` may be behind the bucket.
+
+        :param data: The dump of the deposit.
+        :returns: The updated dump.
+        """
+        files = self._bucket_files()
+        if files is not None and (files or '_files' in data):
+            data['_files'] = files
+        return data
+
+    def dumps(self, **kwargs):
+        """Return pure Python dictionary with deposit metadata."""
+        return self._refresh_files(super(Deposit, self).dumps(**kwargs))
+
+    def replace_refs(self):
+        """Replace the ``$ref`` keys within the JSON."""
+        return current_app.extensions['invenio-records'].replace_refs(
+            self.dumps())
+
+    def _stored_changes(self):
+        """Get the fields changed since the deposit was stored.
+
+        The stored JSON is read again from the database, as the JSON of the
+        model shares its nested objects with the deposit.
+
+        :returns: The set of the changed top-level fields, or ``None`` if the
+            deposit is not stored.
+        """
+        if self.model is None or self.model.id is None:
+            return None
+        with db.session.no_autoflush:
+            stored = db.session.query(self.model_cls.json).filter(
+                self.model_cls.id == self.model.id).scalar()
+        return None if stored is None else diff_fields(stored, self)
 
-    @index
     def commit(self, *args, **kwargs):
-        """Store changes on current instance in database and index it."""
+        """Store changes on current instance in database and index it.
+
+        Nothing is stored, validated or indexed if the deposit is equal to
+        its stored version, e.g. when a client saves it again without changes.
+
+        :param force: Store the deposit without comparing it with its stored
+            version, e.g. when it is known to be changed. The comparison is
+            still done if the partial indexing is enabled, see
+            :data:`invenio_deposit.config.DEPOSIT_PARTIAL_INDEXING_FIELDS`.
+            (Default: ``False``)
+        """
+        force = kwargs.pop('force', False)
+        self._refresh_files(self)
+        self.changed_fields = None
+        if not force or \
+                current_app.config['DEPOSIT_PARTIAL_INDEXING_FIELDS']:
+            self.changed_fields = self._stored_changes()
+            if not force and self.changed_fields == set():
+                return self
+        return self._commit(*args, **kwargs)
+
+    @index
+    def _commit(self, *args, **kwargs):
+        """Store the deposit in database and index it."""
         return super(Deposit, self).commit(*args, **kwargs)
 
+    def reindex(self):
+        """Index the deposit again, without storing a new revision.
+
+        Used after changing the files of the deposit, which does not commit
+        it. Whatever the indexing mode, the deposit is indexed once the
+        session is committed, so consecutive changes are indexed once.
+
+        :returns: The deposit.
+        """
+        self.changed_fields = None
+        invalidate_responses(self.id)
+        if not db.session.info.get(_SUSPEND_INDEXING):
+            self.indexer.index_on_commit(self)
+        return self
+
     @classmethod
     @index
     def create(cls, data, id_=None):
@@ -232,11 +548,12 @@ class Deposit(Record):
     @contextmanager
     def _process_files(self, record_id, data):
         """Snapshot bucket and add files in record during first publishing."""
-        if self.files:
-            assert not self.files.bucket.locked
-            self.files.bucket.locked = True
-            snapshot = self.files.bucket.snapshot(lock=True)
-            data['_files'] = self.files.dumps(bucket=snapshot.id)
+        files = self.files
+        if files:
+            assert not files.bucket.locked
+            files.bucket.locked = self._files_locked = True
+            snapshot = files.bucket.snapshot(lock=True)
+            data['_files'] = files.dumps(bucket=snapshot.id)
             yield data
             db.session.add(RecordsBuckets(
                 record_id=record_id, bucket_id=snapshot.id
@@ -261,12 +578,15 @@ class Deposit(Record):
             'revision_id': 0,
         }
 
-        data = dict(self.dumps())
+        # The bucket is locked below: store its current files first.
+        self._refresh_files(self)
+        data = dict(super(Deposit, self).dumps())
         data['$schema'] = self.record_schema
 
         with self._process_files(id_, data):
             record = self.published_record_class.create(data, id_=id_)
 
+        self._set_published(record_pid, record)
         return record
 
     def _publish_edited(self):
@@ -280,6 +600,7 @@ class Deposit(Record):
         data['$schema'] = self.record_schema
         data['_deposit'] = self['_deposit']
         record = record.__class__(data, model=record.model)
+        self._set_published(record_pid, record)
         return record
 
     @has_status
@@ -328,9 +649,83 @@ class Deposit(Record):
         else:  # Update after edit
             record = self._publish_edited()
             record.commit()
-        self.commit()
+        self.commit(force=True)
         return self
 
+    @classmethod
+    def publish_many(cls, deposits, chunk_size=None):
+        """Publish many deposits.
+
+        The deposits are published in chunks: each chunk is committed in a
+        single database transaction and indexed, together with the published
+        records, with a single bulk request. With deferred indexing or the
+        indexing outbox, the deposits and the records are instead indexed by
+        the :class:`invenio_deposit.indexer.DepositIndexer` once the chunk is
+        committed.
+
+        A deposit that fails to publish is rolled back on its own and reported
+        in the result, loaded again as stored, without aborting the rest of
+        the batch.
+
+        :param deposits: Iterable of deposits to publish.
+        :param chunk_size: Number of deposits published per transaction.
+            (Default: ``DEPOSIT_PUBLISH_CHUNK_SIZE``)
+        :returns: A list of ``(deposit, error)`` tuples, in the same order as
+            the input. ``error`` is the exception raised while publishing the
+            deposit, which is then a new instance, or ``None`` if it was
+            published.
+        """
+        chunk_size = chunk_size or \
+            current_app.config['DEPOSIT_PUBLISH_CHUNK_SIZE']
+        deposits = list(deposits)
+        results = []
+        for start in range(0, len(deposits), chunk_size):
+            published = []
+            with _suspend_indexing():
+                for deposit in deposits[start:start + chunk_size]:
+                    try:
+                        with db.session.begin_nested():
+                            deposit.publish()
+                    except Exception as exc:
+                        results.append((
+                            deposit.__class__.get_record(deposit.id), exc))
+                    else:
+                        results.append((deposit, None))
+                        published.append(deposit)
+            if cls.indexer.deferred:
+                for deposit in published:
+                    cls.indexer.index(deposit)
+                    cls.indexer.index(deposit.fetch_published()[1])
+                db.session.commit()
+            else:
+                db.session.commit()
+                cls._bulk_index_published(published)
+        return results
+
+    @classmethod
+    def _bulk_index_published(cls, deposits):
+        """Index published deposits and their records with one request.
+
+        :param deposits: List of published deposits.
+        """
+        if not deposits:
+            return
+        pids = {}
+        for deposit in deposits:
+            pid = deposit['_deposit']['pid']
+            pids.setdefault(pid['type'], []).append(pid['value'])
+        record_ids = [
+            pid.object_uuid
+            for pid_type, pid_values in pids.items()
+            for pid in PersistentIdentifier.query.filter(
+                PersistentIdentifier.pid_type == pid_type,
+                PersistentIdentifier.pid_value.in_(pid_values),
+            )
+        ]
+        records = cls.get_records([deposit.id for deposit in deposits])
+        records.extend(cls.published_record_class.get_records(record_ids))
+        cls.indexer.bulk_index_records(records)
+
     def _prepare_edit(self, record):
         """Update selected keys.
 
@@ -390,7 +785,9 @@ class Deposit(Record):
 
         after_record_update.send(
             current_app._get_current_object(), record=self)
-        return self.__class__(self.model.json, model=self.model)
+        deposit = self.__class__(self.model.json, model=self.model)
+        deposit.changed_fields = diff_fields(self, deposit)
+        return deposit
 
     @has_status
     @index
@@ -494,11 +891,57 @@ class Deposit(Record):
             'DEPOSIT_DEFAULT_STORAGE_CLASS'
         ])
 
+    @property
+    def index_routing(self):
+        """Routing key of the deposit in the index.
+
+        See :data:`invenio_deposit.config.DEPOSIT_ROUTING_BY_CREATOR`.
+        """
+        if current_app.config['DEPOSIT_ROUTING_BY_CREATOR']:
+            created_by = self.get('_deposit', {}).get('created_by')
+            if created_by is not None:
+                return str(created_by)
+
     @property
     def status(self):
         """Property for accessing deposit status."""
         return self['_deposit']['status']
 
+    def _bucket_state(self):
+        """Get the state of the files of the deposit bucket.
+
+        :returns: The number of object versions of the bucket and the time of
+            their last update.
+        """
+        return db.session.query(
+            func.count(ObjectVersion.version_id),
+            func.max(ObjectVersion.updated),
+        ).join(
+            RecordsBuckets,
+            RecordsBuckets.bucket_id == ObjectVersion.bucket_id,
+        ).filter(
+            RecordsBuckets.record_id == self.id
+        ).one()
+
+    @property
+    def etag(self):
+        """Strong ETag of the deposit and of the files of its bucket.
+
+        Files can be uploaded, renamed or deleted without a new revision of
+        the deposit, so the versions of the objects of its bucket are counted
+        as well.
+        """
+        count, updated = self._bucket_state()
+        state = '{0}:{1}:{2}'.format(
+            self.revision_id, count, updated.isoformat() if updated else '')
+        return hashlib.md5(state.encode('utf-8')).hexdigest()
+
+    @property
+    def last_modified(self):
+        """Time of the last update of the deposit or of its files."""
+        _, updated = self._bucket_state()
+        return max(self.updated, updated) if updated else self.updated
+
     @property
     def files(self):
         """List of Files inside the deposit.
@@ -509,7 +952,7 @@ class Deposit(Record):
         """
         files_ = super(Deposit, self).files
 
-        if files_:
+        if files_ is not None:
             sort_by_ = files_.sort_by
 
             def sort_by(*args, **kwargs):
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016-2019 CERN.
+#
+# Invenio is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Cache of the serialized deposit responses.
+
+The responses to the deposit reads are stored with a key which depends on the
+ETag of the deposit (see :attr:`invenio_deposit.api.Deposit.etag`), so a
+cached response is never served for another state of the deposit. The
+responses of a deposit are also dropped when it is committed, reindexed or
+when an action is run on it.
+
+A cache backend has three methods:
+
+* ``get(deposit_id, key)`` returns a stored response, or ``None``.
+* ``set(deposit_id, key, value)`` stores a response.
+* ``delete(deposit_id)`` drops all the responses of a deposit.
+
+See :data:`invenio_deposit.config.DEPOSIT_RESPONSE_CACHE`.
+"""
+
+from __future__ import absolute_import, print_function
+
+import json
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class MemoryResponseCache(object):
+    """In-process cache of the deposit responses, with LRU eviction."""
+
+    def __init__(self, maxsize=1000):
+        """Initialize the cache.
+
+        :param maxsize: The maximum number of stored responses.
+            (Default: ``1000``)
+        """
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def get(self, deposit_id, key):
+        """Get a response of a deposit.
+
+        :param deposit_id: The deposit identifier.
+        :param key: The key of the response.
+        :returns: The stored response, or ``None``.
+        """
+        with self._lock:
+            value = self._entries.pop((deposit_id, key), None)
+            if value is not None:
+                self._entries[(deposit_id, key)] = value
+            return value
+
+    def set(self, deposit_id, key, value):
+        """Store a response of a deposit.
+
+        The least recently used responses are dropped beyond ``maxsize``.
+
+        :param deposit_id: The deposit identifier.
+        :param key: The key of the response.
+        :param value: The response.
+        """
+        with self._lock:
+            self._entries.pop((deposit_id, key), None)
+            self._entries[(deposit_id, key)] = value
+            self._keys.setdefault(deposit_id, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                (old_id, old_key), _ = self._entries.popitem(last=False)
+                keys = self._keys[old_id]
+                keys.discard(old_key)
+                if not keys:
+                    del self._keys[old_id]
+
+    def delete(self, deposit_id):
+        """Drop the responses of a deposit.
+
+        :param deposit_id: The deposit identifier.
+        """
+        with self._lock:
+            for key in self._keys.pop(deposit_id, ()):
+                self._entries.pop((deposit_id, key), None)
+
+
+class RedisResponseCache(object):
+    """Cache of the deposit responses in a Redis-compatible store.
+
+    The responses of a deposit are stored in a hash, which expires after
+    ``ttl`` seconds. Configure the store with an LRU ``maxmemory-policy`` to
+    evict the least recently used deposits.
+    """
+
+    def __init__(self, client, prefix='deposit-responses:', ttl=3600):
+        """Initialize the cache.
+
+        :param client: The client of the store, e.g. a
+            :class:`redis.StrictRedis` instance.
+        :param prefix: The prefix of the keys of the store.
+            (Default: ``'deposit-responses:'``)
+        :param ttl: Lifetime of the responses, in seconds. (Default: ``3600``)
+        """
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, deposit_id, key):
+        """Get a response of a deposit.
+
+        :param deposit_id: The deposit identifier.
+        :param key: The key of the response.
+        :returns: The stored response, or ``None``.
+        """
+        return self.client.hget(self.prefix + deposit_id, key)
+
+    def set(self, deposit_id, key, value):
+        """Store a response of a deposit.
+
+        :param deposit_id: The deposit identifier.
+        :param key: The key of the response.
+        :param value: The response.
+        """
+        pipeline = self.client.pipeline()
+        pipeline.hset(self.prefix + deposit_id, key, value)
+        pipeline.expire(self.prefix + deposit_id, self.ttl)
+        pipeline.execute()
+
+    def delete(self, deposit_id):
+        """Drop the responses of a deposit.
+
+        :param deposit_id: The deposit identifier.
+        """
+        self.client.delete(self.prefix + deposit_id)
+
+
+def memory_response_cache_factory(app):
+    """Create an in-process cache of the deposit responses.
+
+    See :data:`invenio_deposit.config.DEPOSIT_RESPONSE_CACHE_SIZE`.
+
+    :param app: The Flask application.
+    :returns: A :class:`MemoryResponseCache` instance.
+    """
+    return MemoryResponseCache(app.config['DEPOSIT_RESPONSE_CACHE_SIZE'])
+
+
+def redis_response_cache_factory(app):
+    """Create a cache of the deposit responses in Redis.
+
+    See :data:`invenio_deposit.config.DEPOSIT_RESPONSE_CACHE_REDIS_URL`.
+
+    :param app: The Flask application.
+    :returns: A :class:`RedisResponseCache` instance.
+    """
+    from redis import StrictRedis
+
+    return RedisResponseCache(
+        StrictRedis.from_url(app.config['DEPOSIT_RESPONSE_CACHE_REDIS_URL']),
+        ttl=app.config['DEPOSIT_RESPONSE_CACHE_TTL'],
+    )
+
+
+def dump_response(response):
+    """Dump a response to store it in a cache.
+
+    :param response: The :class:`flask.Response` instance.
+    :returns: The status, headers and body of the response, as bytes.
+    """
+    meta = json.dumps([response.status_code, list(response.headers)])
+    return meta.encode('utf-8') + b'\n' + response.get_data()
+
+
+def load_response(value):
+    """Load a response stored by :func:`dump_response`.
+
+    :param value: The stored response.
+    :returns: A :class:`flask.Response` instance.
+    """
+    meta, data = value.split(b'\n', 1)
+    status, headers = json.loads(meta.decode('utf-8'))
+    return current_app.response_class(
+        data, status=status, headers=[tuple(header) for header in headers])
+
+
+def invalidate_responses(deposit_id):
+    """Drop the cached responses of a deposit.
+
+    :param deposit_id: The deposit identifier.
+    """
+    state = current_app.extensions.get('invenio-deposit-rest')
+    if state is not None and state.response_cache is not None:
+        state.response_cache.delete(str(deposit_id))
@@ -16,6 +16,9 @@ import click
 from flask import current_app
 from flask.cli import with_appcontext
 from invenio_pidstore import current_pidstore
+from invenio_pidstore.models import PersistentIdentifier
+
+from .utils import deposit_class_from_config
 
 
 def process_minter(value):
@@ -80,8 +83,31 @@ def create(source, ids, force, pid_minter=None):
 
 @deposit.command()
 @click.option('-i', '--id', 'ids', multiple=True)
-def publish(ids):
+@click.option('--chunk-size', type=int, default=None,
+              help='Number of deposits published per transaction.')
+@with_appcontext
+def publish(ids, chunk_size):
     """Publish selected deposits."""
+    deposit_class = deposit_class_from_config()
+    query = PersistentIdentifier.query.filter(
+        PersistentIdentifier.pid_type == 'depid',
+        PersistentIdentifier.pid_value.in_(ids),
+    )
+    deposits = deposit_class.get_records(
+        [pid.object_uuid for pid in query])
+    if len(deposits) != len(set(ids)):
+        found = set(str(d['_deposit']['id']) for d in deposits)
+        raise click.BadParameter('Unknown deposits {0}.'.format(
+            ', '.join(sorted(set(ids) - found))))
+
+    for deposit, error in deposit_class.publish_many(
+            deposits, chunk_size=chunk_size):
+        if error is None:
+            click.secho('Published {0}'.format(deposit['_deposit']['id']),
+                        fg='green')
+        else:
+            click.secho('Failed {0}: {1!r}'.format(
+                deposit['_deposit']['id'], error), fg='red')
 
 
 @deposit.command()
@@ -94,3 +120,18 @@ def edit(ids):
 @click.option('-i', '--id', 'ids', multiple=True)
 def discard(ids):
     """Discard selected deposits."""
+
+
+@deposit.command('index-outbox')
+@click.option('--batch-size', type=int, default=None,
+              help='Number of deposits indexed with a single bulk request.')
+@with_appcontext
+def index_outbox(batch_size):
+    """Index the deposits waiting in the indexing outbox."""
+    deposit_class = deposit_class_from_config()
+    indexed, failed = deposit_class.indexer.process_outbox(
+        deposit_class, batch_size=batch_size)
+    click.secho('Indexed {0} deposits.'.format(indexed), fg='green')
+    if failed:
+        click.secho('Failed to index {0} deposits, they will be retried.'
+                    .format(failed), fg='red')
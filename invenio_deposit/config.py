@@ -26,6 +26,9 @@ DEPOSIT_FILES_API = '/api/files'
 DEPOSIT_PID_MINTER = 'recid'
 """PID minter used for record submissions."""
 
+DEPOSIT_PUBLISH_CHUNK_SIZE = 500
+"""Number of deposits published per transaction in bulk publishing."""
+
 DEPOSIT_JSONSCHEMAS_PREFIX = 'deposits/'
 """Prefix for all deposit JSON schemas."""
 
@@ -55,6 +58,12 @@ DEPOSIT_REST_ENDPOINTS = {
         'search_serializers': {
             'application/json': ('invenio_records_rest.serializers'
                                  ':json_v1_search'),
+            'application/vnd.invenio.deposit-listing+json': (
+                'invenio_deposit.serializers:json_v1_listing'),
+        },
+        'search_serializers_aliases': {
+            'json': 'application/json',
+            'listing': 'application/vnd.invenio.deposit-listing+json',
         },
         'list_route': '/deposits/',
         'indexer_class': None,
@@ -190,6 +199,128 @@ DEPOSIT_DEFAULT_STORAGE_CLASS = 'S'
 DEPOSIT_REGISTER_SIGNALS = True
 """Enable the signals registration."""
 
+DEPOSIT_DEFERRED_INDEXING = False
+"""Defer deposit indexing until the database session is committed.
+
+When enabled, the deposits modified in a transaction are indexed once, with a
+single bulk request, after the transaction is committed. See
+:class:`invenio_deposit.indexer.DepositIndexer`.
+"""
+
+DEPOSIT_INDEXING_OUTBOX = False
+"""Write the modified deposits to the indexing outbox instead of indexing them.
+
+The outbox is written in the same transaction as the deposit changes and is
+drained by the :func:`invenio_deposit.tasks.process_index_outbox` task (e.g.
+scheduled with Celery beat) or by the ``deposit index-outbox`` command.
+"""
+
+DEPOSIT_INDEXING_OUTBOX_BATCH_SIZE = 1000
+"""Number of outbox entries indexed with a single bulk request."""
+
+DEPOSIT_INDEXING_OUTBOX_BACKOFF = 10
+"""Seconds before retrying to index a deposit, doubled at each failure."""
+
+DEPOSIT_INDEXING_OUTBOX_MAX_BACKOFF = 3600
+"""Maximum number of seconds before retrying to index a deposit."""
+
+DEPOSIT_PARTIAL_INDEXING_FIELDS = []
+"""Top-level fields sent alone to the index when only they change.
+
+When a write of a deposit changes only some of these fields, only them and
+``_updated`` are sent to the index with a partial update, instead of the whole
+document. E.g. the ``edit`` action changes ``_deposit``, ``$schema`` and
+``_bucket``, and the ``publish`` action of an edited deposit only
+``_deposit``. Enable it with ``['_deposit', '$schema', '_bucket']``, provided
+that no ``before_record_index`` receiver derives other indexed fields from
+them. Committing with partial indexing enabled compares the deposit with
+its stored version, see :meth:`invenio_deposit.api.Deposit.commit`. The
+deposits indexed after the session commit are always fully reindexed.
+
+The whole document is still dumped, with the ``before_record_index`` signal:
+only the size of the requests is reduced. The partial update is applied only
+if the indexed document is the previous revision of the deposit, otherwise
+the deposit is fully reindexed.
+"""
+
+DEPOSIT_ASYNC_ACTIONS = []
+"""Deposit actions run asynchronously by a Celery task, e.g. ``['publish']``.
+
+The REST API enqueues these actions and replies with ``202 Accepted`` and the
+URL of a job resource which reports the progress of the action.
+"""
+
+DEPOSIT_MERGE_LIST_KEYS = {}
+"""Identity keys of the items of the lists merged on publishing.
+
+When a published record was modified while its deposit was edited, the
+changes are merged on publishing (see
+:meth:`invenio_deposit.api.Deposit.merge_with_published`). The items of the
+lists of objects configured here, by dotted path of the list, are matched by
+their identity key, e.g. ``{'authors': 'orcid'}``: the two versions can add,
+remove or modify different items without conflicting. The other lists
+modified in both versions are merged by position.
+"""
+
+DEPOSIT_MERGE_BASE_CACHE_SIZE = 100
+"""Number of merge bases kept in memory by each process.
+
+The merge base is the revision of the published record which was edited
+(see :meth:`invenio_deposit.api.Deposit.merge_with_published`). It is kept in
+memory so that repeated publishing attempts, e.g. after a merge conflict, do
+not load it again.
+"""
+
+DEPOSIT_PERMISSION_CHECK_ELASTICSEARCH = False
+"""Look up the deposits in Elasticsearch before updating or deleting them.
+
+By default, the update and delete permission factories check the owners of
+the deposit in the database. If enabled, they check instead that the deposit
+is found by the search class of the endpoint, with a request to Elasticsearch
+for each write. See :func:`invenio_deposit.utils.can_elasticsearch`.
+"""
+
+DEPOSIT_ROUTING_BY_CREATOR = False
+"""Route the deposits to the index shard of their creator.
+
+The deposits are indexed with the identifier of their creator as routing key,
+and the searches restricted to the deposits of a user, who is not an admin,
+are routed to the shard of the user: they hit only one shard. Only enable it
+if the owners of the deposits are their creators, as the deposits shared with
+other owners can not be found by their searches. The deposits must be
+reindexed after changing it.
+"""
+
+DEPOSIT_JSON_ENCODER = None
+"""Function encoding the JSON responses of the deposit serializers.
+
+It is called with the data to serialize and returns a string or UTF-8 bytes.
+By default, :func:`json.dumps` is used. The faster encoders
+:func:`invenio_deposit.serializers.orjson_dumps` and
+:func:`invenio_deposit.serializers.ujson_dumps` require the ``orjson`` and
+``ujson`` packages. ``orjson`` writes the non-ASCII characters as UTF-8
+instead of escaping them. See ``examples/benchmarks/json_encoders.py``.
+"""
+
+DEPOSIT_RESPONSE_CACHE = None
+"""Factory of the cache of the serialized deposit responses.
+
+It is called with the application and returns a cache backend (see
+:mod:`invenio_deposit.cache`), e.g.
+``'invenio_deposit.cache:memory_response_cache_factory'`` or
+``'invenio_deposit.cache:redis_response_cache_factory'``. The responses to the
+deposit reads are not cached by default.
+"""
+
+DEPOSIT_RESPONSE_CACHE_SIZE = 1000
+"""Maximum number of responses in the in-process response cache."""
+
+DEPOSIT_RESPONSE_CACHE_REDIS_URL = 'redis://localhost:6379/0'
+"""URL of the Redis store of the response cache."""
+
+DEPOSIT_RESPONSE_CACHE_TTL = 3600
+"""Lifetime, in seconds, of the responses in the Redis response cache."""
+
 DEPOSIT_FORM_TEMPLATES_BASE = 'node_modules/invenio-records-js/dist/templates'
 """Angular Schema Form temmplates location."""
 
@@ -10,7 +10,7 @@
 
 from __future__ import absolute_import, print_function
 
-from invenio_rest.errors import RESTException
+from invenio_rest.errors import FieldError, RESTException
 
 
 class FileAlreadyExists(RESTException):
@@ -27,6 +27,29 @@ class WrongFile(RESTException):
     description = 'Wrong file on input.'
 
 
+class WrongCursor(RESTException):
+    """Error wrong pagination cursor."""
+
+    code = 400
+    description = 'Wrong cursor.'
+
+
+class WrongFileOperation(RESTException):
+    """Error wrong operation in a bulk file operations request."""
+
+    code = 400
+    description = 'Wrong file operation on input.'
+
+    def __init__(self, index, message, **kwargs):
+        """Initialize exception.
+
+        :param index: Position of the operation in the request.
+        :param message: The reason of the failure.
+        """
+        super(WrongFileOperation, self).__init__(
+            errors=[FieldError(str(index), message)], **kwargs)
+
+
 class MergeConflict(RESTException):
     """Error on merging a deposit."""
 
@@ -10,14 +10,17 @@
 
 from __future__ import absolute_import, print_function
 
+import json
 from collections import defaultdict
 
 from invenio_records_rest import utils
 from werkzeug.utils import cached_property
 
 from . import config
+from .merge import MergeBaseCache
 from .receivers import index_deposit_after_publish
 from .signals import post_action
+from .utils import actions_registry
 from .views import rest, ui
 
 
@@ -28,6 +31,49 @@ class _DepositState(object):
         """Initialize state."""
         self.app = app
 
+    @property
+    def actions(self):
+        """Registry of the actions of the deposit classes.
+
+        See :class:`invenio_deposit.utils.DepositActionsRegistry`.
+        """
+        return actions_registry
+
+    @cached_property
+    def link_templates(self):
+        """Compiled deposit link templates.
+
+        See :func:`invenio_deposit.links.deposit_links_factory`.
+        """
+        return {}
+
+    @cached_property
+    def json_encoder(self):
+        """JSON encoder of the deposit serializers.
+
+        See :data:`invenio_deposit.config.DEPOSIT_JSON_ENCODER`.
+        """
+        return utils.obj_or_import_string(
+            self.app.config['DEPOSIT_JSON_ENCODER'], default=json.dumps)
+
+    @cached_property
+    def response_cache(self):
+        """Cache of the serialized deposit responses, or ``None``.
+
+        See :data:`invenio_deposit.config.DEPOSIT_RESPONSE_CACHE`.
+        """
+        factory = utils.obj_or_import_string(
+            self.app.config['DEPOSIT_RESPONSE_CACHE'])
+        return factory(self.app) if factory else None
+
+    @cached_property
+    def merge_bases(self):
+        """Cache of the merge bases of the deposits.
+
+        See :data:`invenio_deposit.config.DEPOSIT_MERGE_BASE_CACHE_SIZE`.
+        """
+        return MergeBaseCache(self.app.config['DEPOSIT_MERGE_BASE_CACHE_SIZE'])
+
     @cached_property
     def jsonschemas(self):
         """Load deposit JSON schemas."""
@@ -0,0 +1,470 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016-2019 CERN.
+#
+# Invenio is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Deposit indexer."""
+
+from __future__ import absolute_import, print_function
+
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from elasticsearch import VERSION as ES_VERSION
+from elasticsearch.exceptions import NotFoundError, TransportError
+from elasticsearch.helpers import bulk
+from flask import current_app
+from invenio_db import db
+from invenio_indexer.api import RecordIndexer
+from sqlalchemy import event, inspect
+from werkzeug.utils import import_string
+
+from .models import DepositIndexOutbox
+
+_PENDING = 'invenio_deposit.indexer.pending'
+"""Session info key of the records waiting for the transaction commit."""
+
+_PREPARED = 'invenio_deposit.indexer.prepared'
+"""Session info key of the bulk actions ready to be sent after commit."""
+
+_PARTIAL_UPDATE_SCRIPT = (
+    "if (ctx._version == params.version) { ctx._source.putAll(params.doc) } "
+    "else { ctx.op = 'none' }"
+)
+"""Painless script of the partial updates, see :meth:`DepositIndexer._update`.
+
+The updated document gets the next version, i.e. the revision of the record.
+"""
+
+
+class DepositIndexer(RecordIndexer):
+    """Deposit indexer.
+
+    Besides the interface of :class:`invenio_indexer.api.RecordIndexer`, it
+    can send the index operations of many already loaded records with a
+    single synchronous bulk request.
+
+    If ``DEPOSIT_DEFERRED_INDEXING`` is enabled, :meth:`index` and
+    :meth:`delete` only mark the record as dirty in the current database
+    session. All the dirty records are sent, deduplicated, with a single bulk
+    request after the session is committed, and dropped if it is rolled back.
+
+    If ``DEPOSIT_INDEXING_OUTBOX`` is enabled, the dirty records are instead
+    written to the :class:`invenio_deposit.models.DepositIndexOutbox` table in
+    the same transaction, and indexed later by :meth:`process_outbox`.
+
+    Otherwise, the records with only some fields changed are sent with a
+    partial update, see ``DEPOSIT_PARTIAL_INDEXING_FIELDS``.
+    """
+
+    @property
+    def deferred(self):
+        """Check if the indexing is deferred until the session commit."""
+        return current_app.config['DEPOSIT_DEFERRED_INDEXING'] or \
+            current_app.config['DEPOSIT_INDEXING_OUTBOX']
+
+    def index(self, record, arguments=None, **kwargs):
+        """Index a record.
+
+        See :meth:`invenio_indexer.api.RecordIndexer.index`.
+
+        The record is fully reindexed if the partial update can not be
+        applied, e.g. if the document is missing or if the cluster does not
+        run the painless update script.
+
+        :param record: Record instance.
+        """
+        if self.deferred and not arguments and not kwargs:
+            return self._defer(record)
+        fields = self.record_to_partial_fields(record)
+        if fields and not arguments and not kwargs:
+            try:
+                response = self._update(record, fields)
+                if response is not None:
+                    return response
+            except NotFoundError:
+                pass
+            except TransportError:
+                current_app.logger.warning(
+                    'Could not partially update {0}, fully reindexing it.'
+                    .format(record.id), exc_info=True)
+        return super(DepositIndexer, self).index(
+            record, arguments=arguments, **kwargs)
+
+    @staticmethod
+    def record_to_partial_fields(record):
+        """Get the fields of a record to send with a partial update.
+
+        See :data:`invenio_deposit.config.DEPOSIT_PARTIAL_INDEXING_FIELDS`.
+
+        :param record: Record instance.
+        :returns: The list of the changed fields, or ``None`` if the record
+            must be fully reindexed.
+        """
+        changed = getattr(record, 'changed_fields', None)
+        allowed = current_app.config['DEPOSIT_PARTIAL_INDEXING_FIELDS']
+        if changed and changed.issubset(allowed) and \
+                all(field in record for field in changed):
+            return sorted(changed)
+        return None
+
+    def delete(self, record, **kwargs):
+        """Delete a record.
+
+        See :meth:`invenio_indexer.api.RecordIndexer.delete`.
+
+        :param record: Record instance.
+        """
+        if self.deferred and not kwargs:
+            return self._defer(record)
+        routing = self.record_to_routing(record)
+        if routing is not None:
+            kwargs.setdefault('routing', routing)
+        return super(DepositIndexer, self).delete(record, **kwargs)
+
+    @staticmethod
+    def record_to_routing(record):
+        """Get the routing key of a record.
+
+        Only the deposits define one, see
+        :attr:`invenio_deposit.api.Deposit.index_routing`.
+
+        :param record: Record instance.
+        :returns: The routing key or ``None``.
+        """
+        return getattr(record, 'index_routing', None)
+
+    @staticmethod
+    def _prepare_record(record, index, doc_type, arguments=None, **kwargs):
+        """Prepare record data for indexing, with its routing key.
+
+        See :meth:`invenio_indexer.api.RecordIndexer._prepare_record`.
+        """
+        routing = DepositIndexer.record_to_routing(record)
+        if routing is not None and arguments is not None:
+            arguments.setdefault('routing', routing)
+        return RecordIndexer._prepare_record(
+            record, index, doc_type, arguments=arguments, **kwargs)
+
+    def bulk_index_records(self, records, es_bulk_kwargs=None):
+        """Index records with a single bulk request.
+
+        As for :meth:`invenio_indexer.api.RecordIndexer.index`, the caller is
+        responsible for ensuring that the records have already been committed
+        to the database.
+
+        :param records: Iterable of record instances.
+        :param es_bulk_kwargs: Passed to
+            :func:`elasticsearch:elasticsearch.helpers.bulk`.
+        :returns: A tuple with the number of successful operations and the
+            list of failed ones.
+        """
+        return self._bulk(
+            [self._record_action(record) for record in records],
+            es_bulk_kwargs=es_bulk_kwargs
+        )
+
+    def process_outbox(self, record_cls, batch_size=None):
+        """Index the deposits waiting in the outbox.
+
+        The entries are processed in batches, each one indexed with a single
+        bulk request and committed on its own. Deposits that fail to index are
+        retried by a later call, with an exponential backoff.
+
+        :param record_cls: The deposit class used to load the deposits. The
+            other records, e.g. published by
+            :meth:`invenio_deposit.api.Deposit.publish_many`, are loaded with
+            the class stored in the outbox.
+        :param batch_size: Number of entries processed per bulk request.
+            (Default: ``DEPOSIT_INDEXING_OUTBOX_BATCH_SIZE``)
+        :returns: A tuple with the number of indexed and failed deposits.
+        """
+        batch_size = batch_size or \
+            current_app.config['DEPOSIT_INDEXING_OUTBOX_BATCH_SIZE']
+        indexed = failed = 0
+        while True:
+            entries = DepositIndexOutbox.query.filter(
+                DepositIndexOutbox.next_attempt <= datetime.utcnow()
+            ).order_by(DepositIndexOutbox.id).limit(
+                batch_size
+            ).with_for_update(skip_locked=True).all()
+            if not entries:
+                break
+            success, errors = self._process_outbox_entries(
+                record_cls, entries)
+            db.session.commit()
+            indexed += success
+            failed += errors
+            if len(entries) < batch_size:
+                break
+        return indexed, failed
+
+    def _process_outbox_entries(self, record_cls, entries):
+        """Index the deposits of a batch of outbox entries.
+
+        :param record_cls: The deposit class used to load the deposits.
+        :param entries: List of outbox entries.
+        :returns: A tuple with the number of indexed and failed deposits.
+        """
+        grouped = OrderedDict()
+        classes = {}
+        for entry in entries:
+            grouped.setdefault(entry.record_id, []).append(entry)
+            classes.setdefault(entry.record_class, set()).add(entry.record_id)
+        records = {}
+        for record_class, record_ids in classes.items():
+            cls = import_string(record_class) if record_class else record_cls
+            records.update(
+                (record.id, record) for record in
+                cls.get_records(list(record_ids), with_deleted=True)
+            )
+
+        actions = []
+        failed = set()
+        for record_id, group in grouped.items():
+            record = records.get(record_id)
+            try:
+                if record is not None and record.model.json is not None:
+                    actions.append(self._record_action(record))
+                elif group[-1].index:
+                    actions.append(self._delete_action_for(
+                        record_id, group[-1].index, group[-1].doc_type,
+                        routing=group[-1].routing))
+            except Exception:
+                current_app.logger.exception(
+                    'Could not index {0}.'.format(record_id))
+                failed.add(record_id)
+
+        _, errors = self._bulk(actions)
+        for error in errors:
+            op_type, info = next(iter(error.items()))
+            if info.get('status') == 404 and op_type == 'delete':
+                continue
+            failed.add(uuid.UUID(info['_id']))
+
+        now = datetime.utcnow()
+        config = current_app.config
+        backoff = config['DEPOSIT_INDEXING_OUTBOX_BACKOFF']
+        max_backoff = config['DEPOSIT_INDEXING_OUTBOX_MAX_BACKOFF']
+        for record_id, group in grouped.items():
+            for entry in group:
+                if record_id in failed:
+                    delay = min(backoff * 2 ** entry.attempts, max_backoff)
+                    entry.next_attempt = now + timedelta(seconds=delay)
+                    entry.attempts += 1
+                else:
+                    db.session.delete(entry)
+        return len(grouped) - len(failed), len(failed)
+
+    def _bulk(self, actions, es_bulk_kwargs=None):
+        """Send the actions with a single bulk request.
+
+        :param actions: List of bulk actions.
+        :param es_bulk_kwargs: Passed to
+            :func:`elasticsearch:elasticsearch.helpers.bulk`.
+        :returns: A tuple with the number of successful operations and the
+            list of failed ones.
+        """
+        if not actions:
+            return 0, []
+
+        es_bulk_kwargs = es_bulk_kwargs or {}
+        es_bulk_kwargs.setdefault(
+            'request_timeout',
+            current_app.config['INDEXER_BULK_REQUEST_TIMEOUT'])
+        success, errors = bulk(
+            self.client,
+            actions,
+            raise_on_error=False,
+            raise_on_exception=False,
+            **es_bulk_kwargs
+        )
+        for error in errors:
+            op_type, info = next(iter(error.items()))
+            current_app.logger.error('Could not {0} {1}: {2}'.format(
+                op_type, info.get('_id'), info.get('error')))
+        return success, errors
+
+    def index_on_commit(self, record):
+        """Index a record once the current session is committed.
+
+        Unlike :meth:`index`, the indexing is deferred whatever the indexing
+        mode: a record marked many times in a session is indexed once.
+
+        :param record: Record instance.
+        """
+        self._defer(record)
+
+    def _defer(self, record):
+        """Mark the record as dirty in the current session.
+
+        :param record: Record instance.
+        """
+        pending = db.session.info.setdefault(_PENDING, OrderedDict())
+        pending.pop(record.id, None)
+        pending[record.id] = (self, record)
+
+    def _update(self, record, fields):
+        """Send the changed fields of a record with a partial update.
+
+        The update is a script applied only if the indexed document is the
+        previous revision of the record: as with the version of the full
+        index requests, an older revision never overwrites a newer one.
+
+        :param record: Record instance.
+        :param fields: The changed top-level fields.
+        :returns: The Elasticsearch response, or ``None`` if the indexed
+            document is not the previous revision.
+        """
+        index, doc_type = self.record_to_index(record)
+        arguments = {}
+        body = self._prepare_record(record, index, doc_type, arguments)
+        index, doc_type = self._prepare_index(index, doc_type)
+        if ES_VERSION[0] < 7:
+            arguments['doc_type'] = doc_type
+        routing = self.record_to_routing(record)
+        if routing is not None:
+            arguments['routing'] = routing
+
+        response = self.client.update(
+            id=str(record.id),
+            index=index,
+            body={'script': {
+                'source': _PARTIAL_UPDATE_SCRIPT,
+                'lang': 'painless',
+                'params': {
+                    'version': record.revision_id - 1,
+                    'doc': {
+                        field: body[field] for field in fields + ['_updated']
+                        if field in body
+                    },
+                },
+            }},
+            **arguments
+        )
+        return None if response.get('result') == 'noop' else response
+
+    def _record_action(self, record):
+        """Bulk index action for a loaded record.
+
+        :param record: Record instance.
+        :returns: Dictionary defining an Elasticsearch bulk 'index' action.
+        """
+        index, doc_type = self.record_to_index(record)
+
+        arguments = {}
+        body = self._prepare_record(record, index, doc_type, arguments)
+        index, doc_type = self._prepare_index(index, doc_type)
+
+        action = {
+            '_op_type': 'index',
+            '_index': index,
+            '_id': str(record.id),
+            '_version': record.revision_id,
+            '_version_type': self._version_type,
+            '_source': body,
+        }
+        if ES_VERSION[0] < 7:
+            action['_type'] = doc_type
+        action.update(arguments)
+
+        return action
+
+    def _record_delete_action(self, record):
+        """Bulk delete action for a loaded record.
+
+        :param record: Record instance.
+        :returns: Dictionary defining an Elasticsearch bulk 'delete' action.
+        """
+        index, doc_type = self.record_to_index(record)
+        return self._delete_action_for(
+            record.id, index, doc_type,
+            routing=self.record_to_routing(record))
+
+    def _delete_action_for(self, record_id, index, doc_type, routing=None):
+        """Bulk delete action for a record identifier.
+
+        :param record_id: Record identifier.
+        :param index: The Elasticsearch index.
+        :param doc_type: The Elasticsearch document type.
+        :param routing: The routing key of the record. (Default: ``None``)
+        :returns: Dictionary defining an Elasticsearch bulk 'delete' action.
+        """
+        index, doc_type = self._prepare_index(index, doc_type)
+
+        action = {
+            '_op_type': 'delete',
+            '_index': index,
+            '_id': str(record_id),
+        }
+        if ES_VERSION[0] < 7:
+            action['_type'] = doc_type
+        if routing is not None:
+            action['routing'] = routing
+
+        return action
+
+    def _pending_action(self, record):
+        """Bulk action matching the current database state of the record.
+
+        :param record: Record instance.
+        :returns: Dictionary defining an Elasticsearch bulk action.
+        """
+        model = record.model
+        if model is not None and inspect(model).persistent and \
+                model.json is not None:
+            return self._record_action(
+                record.__class__(model.json, model=model))
+        return self._record_delete_action(record)
+
+
+@event.listens_for(db.session, 'before_commit')
+def _prepare_pending(session):
+    """Build the bulk actions of the dirty records before commit.
+
+    The actions are built while the session can still emit SQL, so that
+    ``after_commit`` only has to send them. With the outbox enabled, the
+    dirty records are written to the outbox instead.
+    """
+    if session.transaction.nested or not session.info.get(_PENDING):
+        return
+    if current_app.config['DEPOSIT_INDEXING_OUTBOX']:
+        from .api import Deposit
+
+        for indexer, record in session.info.pop(_PENDING).values():
+            index, doc_type = indexer.record_to_index(record)
+            record_class = None if isinstance(record, Deposit) else \
+                '{0.__module__}:{0.__name__}'.format(record.__class__)
+            DepositIndexOutbox.create(
+                record.id, index=index, doc_type=doc_type,
+                routing=indexer.record_to_routing(record),
+                record_class=record_class)
+        return
+    session.flush()
+    prepared = OrderedDict()
+    for indexer, record in session.info.pop(_PENDING).values():
+        prepared.setdefault(indexer, []).append(
+            indexer._pending_action(record))
+    session.info[_PREPARED] = prepared
+
+
+@event.listens_for(db.session, 'after_commit')
+def _send_prepared(session):
+    """Send the bulk actions after the session is committed."""
+    if session.transaction.nested:
+        return
+    for indexer, actions in session.info.pop(_PREPARED, {}).items():
+        indexer._bulk(actions)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _drop_pending(session):
+    """Drop the dirty records if the session is rolled back."""
+    if session.transaction.nested:
+        return
+    session.info.pop(_PENDING, None)
+    session.info.pop(_PREPARED, None)
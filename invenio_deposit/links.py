@@ -9,11 +9,67 @@
 """Links for record serialization."""
 
 from flask import current_app, has_request_context, request, url_for
-from invenio_records_rest.links import default_links_factory
 from invenio_records_rest.proxies import current_records_rest
+from werkzeug.routing import BaseConverter
 
 from .api import Deposit
-from .utils import extract_actions_from_class
+from .utils import actions_registry
+
+_PID_VALUE = '__pid_value__'
+"""PID value placeholder of the link templates."""
+
+_LINK_TEMPLATES_MAX = 64
+"""Maximum number of compiled link templates kept by the application."""
+
+
+def _link_templates(pid_type, deposit_cls):
+    """Compile the links of the deposits of a given PID type.
+
+    The links are built once, with :func:`flask.url_for` and a placeholder
+    PID value, for each endpoint, deposit class and request URL root. Each
+    template is the list of the URL parts around the placeholder.
+
+    :param pid_type: The deposit PID type.
+    :param deposit_cls: The deposit class, which defines the actions.
+    :returns: A tuple with the function quoting the PID value in the URLs and
+        the list of ``(name, parts, quoted)`` link templates.
+    """
+    ui_endpoint = current_app.config.get('DEPOSIT_UI_ENDPOINT')
+    key = (request.url_root, request.blueprint, pid_type, deposit_cls,
+           ui_endpoint)
+    state = current_app.extensions.get('invenio-deposit-rest') or \
+        current_app.extensions['invenio-deposit']
+    cache = state.link_templates
+    templates = cache.get(key)
+    if templates is not None:
+        return templates
+
+    prefix = current_records_rest.default_endpoint_prefixes[pid_type]
+
+    def _url(name, **kwargs):
+        """URL template builder."""
+        endpoint = '.{0}_{1}'.format(prefix, name)
+        return url_for(endpoint, pid_value=_PID_VALUE, _external=True,
+                       **kwargs).split(_PID_VALUE)
+
+    links = [
+        ('self', _url('item'), True),
+        ('files', _url('files'), True),
+    ]
+    if ui_endpoint is not None:
+        links.append(('html', ui_endpoint.format(
+            host=request.host,
+            scheme=request.scheme,
+            pid_value=_PID_VALUE,
+        ).split(_PID_VALUE), False))
+    for action in actions_registry[deposit_cls]:
+        links.append((action, _url('actions', action=action), True))
+
+    if len(cache) >= _LINK_TEMPLATES_MAX:
+        cache.clear()
+    templates = cache[key] = (BaseConverter(current_app.url_map).to_url,
+                              links)
+    return templates
 
 
 def deposit_links_factory(pid):
@@ -31,34 +87,20 @@ def deposit_links_factory(pid):
             ...
         }
 
+    The links are filled in templates compiled on first use, see
+    :func:`_link_templates`.
+
     :param pid: The record PID object.
     :returns: A dictionary that contains all the links.
     """
-    links = default_links_factory(pid)
-
-    def _url(name, **kwargs):
-        """URL builder."""
-        endpoint = '.{0}_{1}'.format(
-            current_records_rest.default_endpoint_prefixes[pid.pid_type],
-            name,
-        )
-        return url_for(endpoint, pid_value=pid.pid_value, _external=True,
-                       **kwargs)
-
-    links['files'] = _url('files')
-
-    ui_endpoint = current_app.config.get('DEPOSIT_UI_ENDPOINT')
-    if ui_endpoint is not None:
-        links['html'] = ui_endpoint.format(
-            host=request.host,
-            scheme=request.scheme,
-            pid_value=pid.pid_value,
-        )
-
     deposit_cls = Deposit
     if 'pid_value' in request.view_args:
         deposit_cls = request.view_args['pid_value'].data[1].__class__
 
-    for action in extract_actions_from_class(deposit_cls):
-        links[action] = _url('actions', action=action)
-    return links
+    to_url, templates = _link_templates(pid.pid_type, deposit_cls)
+    value = pid.pid_value
+    quoted = to_url(value)
+    return {
+        name: (quoted if quote else value).join(parts)
+        for name, parts, quote in templates
+    }
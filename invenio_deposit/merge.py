@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016-2019 CERN.
+#
+# Invenio is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Three-way merge of the deposits with their published records.
+
+The merge walks the three versions together and only looks into the subtrees
+changed on both sides: a subtree changed on one side only is taken as is. The
+lists of objects configured in
+:data:`invenio_deposit.config.DEPOSIT_MERGE_LIST_KEYS` are merged item by item,
+matching the items by their identity key. The other lists changed on both
+sides are merged with :mod:`dictdiffer`.
+
+The common ancestors of the merges are kept in a :class:`MergeBaseCache`.
+"""
+
+from __future__ import absolute_import, print_function
+
+import threading
+from collections import OrderedDict
+from copy import deepcopy
+
+from dictdiffer import patch
+from dictdiffer.merge import Merger, UnresolvedConflictsException
+
+from .errors import MergeConflict
+
+_MISSING = object()
+"""Marker of a missing key."""
+
+
+class MergeBaseCache(object):
+    """In-process cache of the merge bases, with LRU eviction.
+
+    The merge base of a deposit is the revision of the published record it
+    was edited from. The revisions of a record never change, so the cached
+    merge bases are never invalidated.
+    """
+
+    def __init__(self, maxsize=100):
+        """Initialize the cache.
+
+        :param maxsize: The maximum number of stored merge bases.
+            (Default: ``100``)
+        """
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, record_id, revision_id):
+        """Get a merge base.
+
+        :param record_id: The record identifier.
+        :param revision_id: The revision identifier.
+        :returns: The data of the revision, which must not be modified, or
+            ``None``.
+        """
+        with self._lock:
+            data = self._entries.pop((record_id, revision_id), None)
+            if data is not None:
+                self._entries[(record_id, revision_id)] = data
+            return data
+
+    def set(self, record_id, revision_id, data):
+        """Store a merge base.
+
+        The least recently used merge bases are dropped beyond ``maxsize``.
+
+        :param record_id: The record identifier.
+        :param revision_id: The revision identifier.
+        :param data: The data of the revision.
+        """
+        with self._lock:
+            self._entries.pop((record_id, revision_id), None)
+            self._entries[(record_id, revision_id)] = data
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+def merge(lca, first, second, list_keys=None):
+    """Merge the changes of two versions of a document.
+
+    The inputs are not modified and the merged document shares no objects
+    with them.
+
+    :param lca: The latest common ancestor of the two versions.
+    :param first: The first version.
+    :param second: The second version.
+    :param list_keys: The identity keys of the items of the lists, by dotted
+        path of the lists, e.g. ``{'authors': 'orcid'}``. (Default: ``None``)
+    :raises invenio_deposit.errors.MergeConflict: If the two versions changed
+        the same value in different ways.
+    :returns: The merged document.
+    """
+    return deepcopy(_merge(lca, first, second, '', list_keys or {}))
+
+
+def _merge(lca, first, second, path, list_keys):
+    """Merge two versions of a value.
+
+    :param lca: The common ancestor value, or ``_MISSING``.
+    :param first: The first value, or ``_MISSING``.
+    :param second: The second value, or ``_MISSING``.
+    :param path: The dotted path of the value.
+    :param list_keys: The identity keys of the items of the lists.
+    :returns: The merged value, or ``_MISSING`` if it is removed.
+    """
+    if first == second or second == lca:
+        return first
+    if first == lca:
+        return second
+    if isinstance(lca, dict) and isinstance(first, dict) and \
+            isinstance(second, dict):
+        result = {}
+        keys = list(second) + [key for key in first if key not in second]
+        for key in keys:
+            value = _merge(
+                lca.get(key, _MISSING), first.get(key, _MISSING),
+                second.get(key, _MISSING),
+                '{0}.{1}'.format(path, key) if path else key, list_keys)
+            if value is not _MISSING:
+                result[key] = value
+        return result
+    if isinstance(lca, list) and isinstance(first, list) and \
+            isinstance(second, list):
+        if path in list_keys:
+            result = _merge_keyed_list(
+                lca, first, second, path, list_keys)
+            if result is not None:
+                return result
+        return _merge_dictdiffer(lca, first, second)
+    raise MergeConflict()
+
+
+def _index_list(items, key):
+    """Index the items of a list by their identity key.
+
+    :param items: The list of objects.
+    :param key: The identity key.
+    :returns: An ordered dictionary of the items, or ``None`` if an item is
+        not an object or if its key is missing, duplicated or not hashable.
+    """
+    index = OrderedDict()
+    for item in items:
+        if not isinstance(item, dict) or key not in item:
+            return None
+        try:
+            if item[key] in index:
+                return None
+        except TypeError:
+            return None
+        index[item[key]] = item
+    return index
+
+
+def _merge_keyed_list(lca, first, second, path, list_keys):
+    """Merge two versions of a list of objects by identity key.
+
+    :returns: The merged list, or ``None`` if the items can not be matched.
+    """
+    indexes = [_index_list(items, list_keys[path])
+               for items in (lca, first, second)]
+    if None in indexes:
+        return None
+    lca_index, first_index, second_index = indexes
+    items = {}
+    for id_ in set(lca_index) | set(first_index) | set(second_index):
+        item = _merge(
+            lca_index.get(id_, _MISSING), first_index.get(id_, _MISSING),
+            second_index.get(id_, _MISSING), path, list_keys)
+        if item is not _MISSING:
+            items[id_] = item
+    order = _merge_order(
+        list(lca_index), list(first_index), list(second_index), items)
+    return [items[id_] for id_ in order]
+
+
+def _merge_order(lca, first, second, ids):
+    """Merge the orders of the items of two versions of a list.
+
+    The order of the version which moved some items is kept, with the items
+    added by the other version inserted after their predecessor.
+
+    :param lca: The identities of the common ancestor items.
+    :param first: The identities of the first version items.
+    :param second: The identities of the second version items.
+    :param ids: The identities of the merged items.
+    :raises invenio_deposit.errors.MergeConflict: If both versions moved the
+        same items in different ways.
+    :returns: The ordered identities of the merged items.
+    """
+    def common(order, other):
+        other = set(other)
+        return [id_ for id_ in order if id_ in other]
+
+    first_moved = common(first, lca) != common(lca, first)
+    second_moved = common(second, lca) != common(lca, second)
+    if first_moved and second_moved and \
+            common(first, second) != common(second, first):
+        raise MergeConflict()
+    main, other = (first, second) if first_moved else (second, first)
+    order = [id_ for id_ in main if id_ in ids]
+    placed = set(order)
+    previous = None
+    for id_ in other:
+        if id_ not in ids:
+            continue
+        if id_ not in placed:
+            order.insert(
+                order.index(previous) + 1 if previous is not None else 0,
+                id_)
+            placed.add(id_)
+        previous = id_
+    return order
+
+
+def _merge_dictdiffer(lca, first, second):
+    """Merge two versions of a value with :mod:`dictdiffer`.
+
+    :raises invenio_deposit.errors.MergeConflict: If the versions conflict.
+    :returns: The merged value.
+    """
+    merger = Merger({'value': lca}, {'value': first}, {'value': second}, {})
+    try:
+        merger.run()
+    except UnresolvedConflictsException:
+        raise MergeConflict()
+    return patch(merger.unified_patches, {'value': lca})['value']
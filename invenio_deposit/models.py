@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016-2019 CERN.
+#
+# Invenio is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Deposit models."""
+
+from __future__ import absolute_import, print_function
+
+import uuid
+from datetime import datetime
+from enum import Enum
+
+from invenio_db import db
+from sqlalchemy_utils.models import Timestamp
+from sqlalchemy_utils.types import ChoiceType, UUIDType
+
+
+class DepositIndexOutbox(db.Model, Timestamp):
+    """Deposit waiting to be indexed.
+
+    An entry is written in the same transaction that modifies the deposit and
+    it is removed once the deposit is indexed, see
+    :meth:`invenio_deposit.indexer.DepositIndexer.process_outbox`.
+    """
+
+    __tablename__ = 'deposit_index_outbox'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    """Entry identifier."""
+
+    record_id = db.Column(UUIDType, nullable=False, index=True)
+    """Identifier of the deposit to index."""
+
+    index = db.Column(db.String(255), nullable=True)
+    """Index of the deposit, used to delete it once removed."""
+
+    doc_type = db.Column(db.String(255), nullable=True)
+    """Document type of the deposit, used to delete it once removed."""
+
+    routing = db.Column(db.String(255), nullable=True)
+    """Routing key of the deposit, used to delete it once removed."""
+
+    record_class = db.Column(db.String(255), nullable=True)
+    """Import path of the record class, e.g. of the published records.
+
+    The entries without it are loaded with the deposit class given to
+    :meth:`invenio_deposit.indexer.DepositIndexer.process_outbox`.
+    """
+
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    """Number of failed indexing attempts."""
+
+    next_attempt = db.Column(
+        db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    """Date after which the deposit can be (re)indexed."""
+
+    @classmethod
+    def create(cls, record_id, index=None, doc_type=None, routing=None,
+               record_class=None):
+        """Add an entry to the outbox.
+
+        :param record_id: Identifier of the deposit to index.
+        :param index: Index of the deposit. (Default: ``None``)
+        :param doc_type: Document type of the deposit. (Default: ``None``)
+        :param routing: Routing key of the deposit. (Default: ``None``)
+        :param record_class: Import path of the record class.
+            (Default: ``None``)
+        :returns: The new entry.
+        """
+        entry = cls(record_id=record_id, index=index, doc_type=doc_type,
+                    routing=routing, record_class=record_class)
+        db.session.add(entry)
+        return entry
+
+
+class DepositActionJobStatus(Enum):
+    """Constants for the status of a deposit action job."""
+
+    __order__ = 'QUEUED RUNNING SUCCEEDED FAILED'
+
+    QUEUED = 'Q'
+    """The action waits for a worker."""
+
+    RUNNING = 'R'
+    """The action is running."""
+
+    SUCCEEDED = 'S'
+    """The action has been committed."""
+
+    FAILED = 'F'
+    """The action has failed and has been rolled back, or a receiver of
+    :data:`invenio_deposit.signals.post_action` has failed."""
+
+
+class DepositActionJob(db.Model, Timestamp):
+    """Deposit action run asynchronously.
+
+    See :data:`invenio_deposit.config.DEPOSIT_ASYNC_ACTIONS`.
+    """
+
+    __tablename__ = 'deposit_action_job'
+
+    __table_args__ = (
+        db.Index('idx_deposit_action_job_pid', 'pid_type', 'pid_value'),
+    )
+
+    id = db.Column(UUIDType, primary_key=True, default=uuid.uuid4)
+    """Job identifier."""
+
+    pid_type = db.Column(db.String(6), nullable=False)
+    """Type of the deposit PID."""
+
+    pid_value = db.Column(db.String(255), nullable=False)
+    """Value of the deposit PID."""
+
+    action = db.Column(db.String(255), nullable=False)
+    """Name of the deposit action."""
+
+    status = db.Column(
+        ChoiceType(DepositActionJobStatus, impl=db.CHAR(1)),
+        nullable=False,
+        default=DepositActionJobStatus.QUEUED,
+    )
+    """Status of the job."""
+
+    started = db.Column(db.DateTime, nullable=True)
+    """Date when the action started."""
+
+    finished = db.Column(db.DateTime, nullable=True)
+    """Date when the action succeeded or failed."""
+
+    error = db.Column(db.Text, nullable=True)
+    """Reason of the failure."""
+
+    @classmethod
+    def create(cls, pid, action):
+        """Create a queued job.
+
+        :param pid: The deposit PID.
+        :param action: Name of the deposit action.
+        :returns: The new job.
+        """
+        job = cls(id=uuid.uuid4(), pid_type=pid.pid_type,
+                  pid_value=pid.pid_value, action=action,
+                  status=DepositActionJobStatus.QUEUED)
+        db.session.add(job)
+        return job
+
+    def start(self):
+        """Mark the job as running."""
+        self.status = DepositActionJobStatus.RUNNING
+        self.started = datetime.utcnow()
+
+    def finish(self, error=None):
+        """Mark the job as finished.
+
+        :param error: Reason of the failure, if any. (Default: ``None``)
+        """
+        self.status = DepositActionJobStatus.FAILED if error \
+            else DepositActionJobStatus.SUCCEEDED
+        self.error = error
+        self.finished = datetime.utcnow()
+
+
+__all__ = (
+    'DepositActionJob',
+    'DepositActionJobStatus',
+    'DepositIndexOutbox',
+)
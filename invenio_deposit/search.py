@@ -9,7 +9,7 @@
 """Configuration for deposit search."""
 
 from elasticsearch_dsl import Q, TermsFacet
-from flask import has_request_context
+from flask import current_app, has_request_context
 from flask_login import current_user
 from invenio_search import RecordsSearch
 from invenio_search.api import DefaultFilter
@@ -17,6 +17,17 @@ from invenio_search.api import DefaultFilter
 from .permissions import admin_permission_factory
 
 
+def _owner():
+    """Get the owner whose deposits are searched.
+
+    :returns: The identifier of the current user, or ``None`` if all the
+        deposits are searched.
+    """
+    if not has_request_context() or admin_permission_factory().can():
+        return None
+    return getattr(current_user, 'id', 0)
+
+
 def deposits_filter():
     """Filter list of deposits.
 
@@ -27,18 +38,24 @@ def deposits_filter():
 
     * It's called outside of a request.
 
-    Otherwise, it filters out any deposit where user is not the owner.
+    Otherwise, it filters out any deposit where user is not the owner. The
+    owner is matched with a ``term`` query, which is applied in filter
+    context and cached by Elasticsearch.
     """
-    if not has_request_context() or admin_permission_factory().can():
+    owner = _owner()
+    if owner is None:
         return Q()
     else:
-        return Q(
-            'match', **{'_deposit.owners': getattr(current_user, 'id', 0)}
-        )
+        return Q('term', **{'_deposit.owners': owner})
 
 
 class DepositSearch(RecordsSearch):
-    """Default search class."""
+    """Default search class.
+
+    If :data:`invenio_deposit.config.DEPOSIT_ROUTING_BY_CREATOR` is enabled,
+    the searches restricted to the deposits of a user are routed to the shard
+    of the user.
+    """
 
     class Meta:
         """Configuration for deposit search."""
@@ -50,3 +67,13 @@ class DepositSearch(RecordsSearch):
             'status': TermsFacet(field='_deposit.status'),
         }
         default_filter = DefaultFilter(deposits_filter)
+
+    def __init__(self, **kwargs):
+        """Initialize the search, routed to the shard of the owner."""
+        super(DepositSearch, self).__init__(**kwargs)
+        if has_request_context() and \
+                current_app.config['DEPOSIT_ROUTING_BY_CREATOR'] and \
+                'routing' not in self._params:
+            owner = _owner()
+            if owner is not None:
+                self._params['routing'] = str(owner)
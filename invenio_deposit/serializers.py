@@ -10,7 +10,63 @@
 
 import json
 
-from flask import Response, jsonify, make_response
+from flask import Response, current_app
+from invenio_records_rest.serializers.json import JSONSerializerMixin, lt_es7
+from invenio_records_rest.serializers.response import search_responsify
+
+
+def orjson_dumps(data):
+    """Encode data in JSON with ``orjson``.
+
+    Unlike :func:`json.dumps`, the non-ASCII characters are written as UTF-8
+    instead of being escaped: the documents differ but decode to the same
+    data.
+
+    :param data: The data to encode.
+    :returns: The JSON document, as UTF-8 bytes.
+    """
+    import orjson
+    return orjson.dumps(data)
+
+
+def ujson_dumps(data):
+    """Encode data in JSON with ``ujson``.
+
+    The non-ASCII characters are escaped as by :func:`json.dumps`.
+
+    :param data: The data to encode.
+    :returns: The JSON document, as a string.
+    """
+    import ujson
+    return ujson.dumps(data, ensure_ascii=True, escape_forward_slashes=False)
+
+
+def json_dumps(data):
+    """Encode data in JSON with the encoder of the application.
+
+    See :data:`invenio_deposit.config.DEPOSIT_JSON_ENCODER`.
+
+    :param data: The data to encode.
+    :returns: The JSON document, as a string or as UTF-8 bytes.
+    """
+    state = current_app.extensions.get('invenio-deposit-rest') or \
+        current_app.extensions['invenio-deposit']
+    return state.json_encoder(data)
+
+
+def json_response(data, status=None):
+    """Build a JSON Flask response using the given data.
+
+    :param data: The data to encode.
+    :param status: A HTTP Status. (Default: ``None``)
+    :returns: A Flask response with JSON data.
+    :rtype: :py:class:`flask.Response`.
+    """
+    response = current_app.response_class(
+        json_dumps(data), mimetype='application/json')
+    if status is not None:
+        response.status_code = status
+    return response
 
 
 def json_serializer(pid, data, *args):
@@ -24,7 +80,7 @@ def json_serializer(pid, data, *args):
     """
     if data is not None:
         response = Response(
-            json.dumps(data.dumps()),
+            json_dumps(data.dumps()),
             mimetype='application/json'
         )
     else:
@@ -46,6 +102,60 @@ def file_serializer(obj):
     }
 
 
+def part_serializer(part):
+    """Serialize a part of a chunked upload.
+
+    :param part: A :class:`invenio_files_rest.models.Part` instance.
+    :returns: A dictionary with the fields to serialize.
+    """
+    return {
+        "part_number": part.part_number,
+        "start_byte": part.start_byte,
+        "end_byte": part.end_byte,
+        "checksum": part.checksum,
+    }
+
+
+def multipart_serializer(multipart):
+    """Serialize a chunked upload, with its uploaded parts.
+
+    :param multipart: A :class:`invenio_files_rest.models.MultipartObject`
+        instance.
+    :returns: A dictionary with the fields to serialize.
+    """
+    from invenio_files_rest.models import Part
+
+    return {
+        "upload_id": str(multipart.upload_id),
+        "filename": multipart.key,
+        "filesize": multipart.size,
+        "part_size": multipart.chunk_size,
+        "last_part_number": multipart.last_part_number,
+        "completed": multipart.completed,
+        "parts": [
+            part_serializer(part) for part in Part.query_by_multipart(
+                multipart).order_by(Part.part_number)
+        ],
+    }
+
+
+def batch_serializer(results):
+    """Serialize the results of a batch upload.
+
+    :param results: List of ``(filename, obj, error)`` tuples, where ``obj``
+        is the created :class:`invenio_files_rest.models.ObjectVersion`
+        instance, or ``None`` if the HTTP exception ``error`` was raised.
+    :returns: A list with the serialized files or errors.
+    """
+    return [
+        file_serializer(obj) if error is None else {
+            "filename": filename,
+            "status": error.code,
+            "message": error.description,
+        } for filename, obj, error in results
+    ]
+
+
 def json_file_serializer(obj, status=None):
     """JSON File Serializer.
 
@@ -54,7 +164,7 @@ def json_file_serializer(obj, status=None):
     :returns: A Flask response with JSON data.
     :rtype: :py:class:`flask.Response`.
     """
-    return make_response(jsonify(file_serializer(obj)), status)
+    return json_response(file_serializer(obj), status)
 
 
 def json_files_serializer(objs, status=None):
@@ -67,28 +177,158 @@ def json_files_serializer(objs, status=None):
     :rtype: :py:class:`flask.Response`.
     """
     files = [file_serializer(obj) for obj in objs]
-    return make_response(json.dumps(files), status)
+    return json_response(files, status)
 
 
 def json_file_response(obj=None, pid=None, record=None, status=None):
     """JSON Files/File serializer.
 
-    :param obj: A :class:`invenio_files_rest.models.ObjectVersion` instance or
+    :param obj: A :class:`invenio_files_rest.models.ObjectVersion` instance,
         a :class:`invenio_records_files.api.FilesIterator` if it's a list of
-        files.
+        files, or a :class:`invenio_files_rest.models.MultipartObject` or
+        :class:`invenio_files_rest.models.Part` instance for chunked uploads,
+        or a list with the results of a batch upload.
     :param pid: PID value. (not used)
     :param record: The record metadata. (not used)
     :param status: The HTTP status code.
     :returns: A Flask response with JSON data.
     :rtype: :py:class:`flask.Response`.
     """
+    from invenio_files_rest.models import MultipartObject, Part
     from invenio_records_files.api import FilesIterator
 
     if isinstance(obj, FilesIterator):
         return json_files_serializer(obj, status=status)
+    elif isinstance(obj, MultipartObject):
+        return json_response(multipart_serializer(obj), status)
+    elif isinstance(obj, Part):
+        return json_response(part_serializer(obj), status)
+    elif isinstance(obj, list):
+        return json_response(batch_serializer(obj), status)
     else:
         return json_file_serializer(obj, status=status)
 
 
 json_v1_files_response = json_file_response
 """Default JSON files response."""
+
+
+def job_serializer(job, links=None):
+    """Serialize a deposit action job.
+
+    :param job: A :class:`invenio_deposit.models.DepositActionJob` instance.
+    :param links: Dictionary of links of the job. (Default: ``None``)
+    :returns: A dictionary with the fields to serialize.
+    """
+    def isoformat(date):
+        return date.isoformat() if date else None
+
+    return {
+        "id": str(job.id),
+        "action": job.action,
+        "status": job.status.name.lower(),
+        "created": isoformat(job.created),
+        "started": isoformat(job.started),
+        "finished": isoformat(job.finished),
+        "error": job.error,
+        "links": links or {},
+    }
+
+
+def json_job_response(job, links=None, status=None):
+    """JSON deposit action job response.
+
+    :param job: A :class:`invenio_deposit.models.DepositActionJob` instance.
+    :param links: Dictionary of links of the job. (Default: ``None``)
+    :param status: The HTTP status code.
+    :returns: A Flask response with JSON data.
+    :rtype: :py:class:`flask.Response`.
+    """
+    return json_response(job_serializer(job, links=links), status)
+
+
+class DepositListingSerializer(JSONSerializerMixin):
+    """Slim JSON serializer of deposit search results.
+
+    The hits are serialized as they are fetched from Elasticsearch, without
+    a Marshmallow schema, to list the deposits with a few of their fields.
+    """
+
+    def serialize_search(self, pid_fetcher, search_result, links=None,
+                         item_links_factory=None, **kwargs):
+        """Serialize a search result.
+
+        The result is encoded with :func:`json_dumps`, unless it is pretty
+        printed.
+
+        :param pid_fetcher: Persistent identifier fetcher.
+        :param search_result: Elasticsearch search result.
+        :param links: Dictionary of links to add to response.
+            (Default: ``None``)
+        :param item_links_factory: Factory of the links of the deposits.
+            (Default: ``None``)
+        :returns: The JSON document.
+        """
+        total = search_result['hits']['total'] if lt_es7 else \
+            search_result['hits']['total']['value']
+        data = dict(
+            hits=dict(
+                hits=[self.transform_search_hit(
+                    pid_fetcher(hit['_id'], hit['_source']),
+                    hit,
+                    links_factory=item_links_factory,
+                    **kwargs
+                ) for hit in search_result['hits']['hits']],
+                total=total,
+            ),
+            links=links or {},
+            aggregations=search_result.get('aggregations', dict()),
+        )
+        format_args = self._format_args()
+        if format_args.get('indent'):
+            return json.dumps(data, **format_args)
+        return json_dumps(data)
+
+    def transform_search_hit(self, pid, record_hit, links_factory=None,
+                             **kwargs):
+        """Transform a search hit into a dictionary.
+
+        :param pid: The `invenio_pidstore.models.PersistentIdentifier` of the
+            deposit.
+        :param record_hit: The Elasticsearch hit.
+        :param links_factory: Factory of the links of the deposit.
+            (Default: ``None``)
+        :returns: A dictionary with the fields to serialize.
+        """
+        metadata = dict(record_hit['_source'])
+        return {
+            "id": pid.pid_value,
+            "metadata": metadata,
+            "created": metadata.pop('_created', None),
+            "updated": metadata.pop('_updated', None),
+            "revision": record_hit['_version'],
+            "links": links_factory(pid, record_hit=record_hit, **kwargs)
+            if links_factory else {},
+        }
+
+
+def listing_responsify(source_includes, mimetype):
+    """Create a deposit listing response serializer.
+
+    The deposit list resource fetches from Elasticsearch only the fields of
+    the deposits in ``source_includes`` when it uses this serializer.
+
+    :param source_includes: List of the fields of the listed deposits.
+    :param mimetype: MIME type of response.
+    :returns: Function that generates a search HTTP response.
+    """
+    view = search_responsify(DepositListingSerializer(), mimetype)
+    view.source_includes = list(source_includes)
+    return view
+
+
+json_v1_listing = listing_responsify(
+    ['_deposit', 'title', '_created', '_updated'],
+    'application/vnd.invenio.deposit-listing+json',
+)
+"""Deposit listing response, with the status, title and timestamps."""
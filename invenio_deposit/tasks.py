@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016-2019 CERN.
+#
+# Invenio is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""Celery tasks for deposit."""
+
+from __future__ import absolute_import, print_function
+
+from celery import shared_task
+from flask import current_app
+from invenio_db import db
+from invenio_files_rest.models import MultipartObject
+from invenio_files_rest.signals import file_uploaded
+from invenio_pidstore.models import PersistentIdentifier
+
+from .models import DepositActionJob
+from .signals import post_action
+from .utils import commit_action, deposit_class_from_config
+
+
+@shared_task(ignore_result=True)
+def process_index_outbox(batch_size=None):
+    """Index the deposits waiting in the indexing outbox.
+
+    :param batch_size: Number of entries indexed with a single bulk request.
+        (Default: ``DEPOSIT_INDEXING_OUTBOX_BATCH_SIZE``)
+    """
+    deposit_class = deposit_class_from_config()
+    deposit_class.indexer.process_outbox(deposit_class, batch_size=batch_size)
+
+
+@shared_task(ignore_result=True)
+def merge_multipart_upload(upload_id, record_id, pid_type='depid'):
+    """Add the file of a completed chunked upload to a deposit.
+
+    The parts are merged and the checksum of the whole file is computed, then
+    the deposit is reindexed.
+
+    :param upload_id: The :class:`invenio_files_rest.models.MultipartObject`
+        upload identifier.
+    :param record_id: The deposit identifier.
+    :param pid_type: The deposit PID type. (Default: ``'depid'``)
+    """
+    multipart = MultipartObject.query.filter_by(upload_id=upload_id).one()
+    obj = multipart.merge_parts()
+    deposit_class_from_config(pid_type).get_record(record_id).reindex()
+    db.session.commit()
+    file_uploaded.send(current_app._get_current_object(), obj=obj)
+
+
+@shared_task(ignore_result=True)
+def run_deposit_action(job_id):
+    """Run a deposit action enqueued by the REST API.
+
+    Once the action is committed, the
+    :data:`invenio_deposit.signals.post_action` signal is sent. The job
+    records the progress and the failure of the action or of a receiver of
+    the signal.
+
+    :param job_id: The :class:`invenio_deposit.models.DepositActionJob`
+        identifier.
+    """
+    job = DepositActionJob.query.get(job_id)
+    job.start()
+    db.session.commit()
+
+    try:
+        pid = PersistentIdentifier.get(job.pid_type, job.pid_value)
+        deposit = deposit_class_from_config(job.pid_type).get_record(
+            pid.object_uuid)
+        deposit = getattr(deposit, job.action)(pid=pid)
+        commit_action()
+        post_action.send(current_app._get_current_object(),
+                         action=job.action, pid=pid, deposit=deposit)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception(
+            'Could not {0} {1}.'.format(job.action, job.pid_value))
+        job = DepositActionJob.query.get(job_id)
+        job.finish(error=getattr(e, 'description', None) or
+                   e.__class__.__name__)
+        db.session.commit()
+        return
+
+    job.finish()
+    db.session.commit()
@@ -10,9 +10,15 @@
 
 from __future__ import absolute_import, print_function
 
-from flask import request
+from weakref import WeakKeyDictionary
+
+from flask import current_app, request
+from flask_login import current_user
+from invenio_db import db
 from invenio_oauth2server import require_api_auth, require_oauth_scopes
+from invenio_records_rest.utils import obj_or_import_string
 
+from .permissions import admin_permission_factory
 from .scopes import write_scope
 
 
@@ -58,6 +64,110 @@ def extract_actions_from_class(record_class):
             yield method.__name__
 
 
+class DepositActionsRegistry(object):
+    """Registry of the actions of the deposit classes.
+
+    The actions of a class are extracted with
+    :func:`extract_actions_from_class` only the first time they are looked
+    up. A subclass, which can add or hide actions, gets its own entry.
+
+    .. code-block:: python
+
+        assert 'publish' in actions_registry[Deposit]
+    """
+
+    def __init__(self):
+        """Initialize the registry."""
+        self._actions = WeakKeyDictionary()
+
+    def __getitem__(self, record_class):
+        """Get the actions of a deposit class.
+
+        :param record_class: The deposit class.
+        :returns: A tuple with the names of the actions.
+        """
+        try:
+            return self._actions[record_class]
+        except KeyError:
+            actions = self._actions[record_class] = tuple(
+                extract_actions_from_class(record_class))
+            return actions
+
+
+actions_registry = DepositActionsRegistry()
+"""Actions of the deposit classes, shared by the links and the REST API."""
+
+
+def deposit_class_from_config(pid_type='depid'):
+    """Load the deposit class configured for the given PID type.
+
+    See :data:`invenio_deposit.config.DEPOSIT_REST_ENDPOINTS`.
+
+    :param pid_type: Deposit PID type. (Default: ``'depid'``)
+    :returns: The deposit class.
+    """
+    record_class = 'invenio_deposit.api:Deposit'
+    for options in current_app.config['DEPOSIT_REST_ENDPOINTS'].values():
+        if options.get('pid_type') == pid_type:
+            record_class = options.get('record_class', record_class)
+            break
+    return obj_or_import_string(record_class)
+
+
+def commit_action():
+    """Commit the session of a deposit action.
+
+    Unlike :meth:`sqlalchemy.orm.session.Session.commit`, the loaded instances
+    are not expired: the PID, the deposit and the published record are used
+    right after the action, to send the
+    :data:`invenio_deposit.signals.post_action` signal and build the response,
+    and their state is already up to date.
+    """
+    session = db.session()
+    expire_on_commit = session.expire_on_commit
+    session.expire_on_commit = False
+    try:
+        session.commit()
+    finally:
+        session.expire_on_commit = expire_on_commit
+
+
+def project(data, fields):
+    """Select some fields of a JSON document.
+
+    A field is a dotted path, e.g. ``_deposit.status``, which selects the
+    field in each item of the lists it goes through.
+
+    :param data: The JSON document.
+    :param fields: The list of fields to select.
+    :returns: A new document with the selected fields only.
+    """
+    tree = {}
+    for field in fields:
+        keys = field.split('.')
+        node = tree
+        for key in keys[:-1]:
+            if key in node and node[key] is None:
+                break
+            node = node.setdefault(key, {})
+        else:
+            node[keys[-1]] = None
+
+    def _project(value, tree):
+        if isinstance(value, list):
+            return [_project(item, tree) for item in value
+                    if isinstance(item, dict)]
+        return {
+            key: value[key] if subtree is None else
+            _project(value[key], subtree)
+            for key, subtree in tree.items()
+            if key in value and (subtree is None or
+                                 isinstance(value[key], (dict, list)))
+        }
+
+    return _project(data, tree)
+
+
 def check_oauth2_scope(can_method, *myscopes):
     """Base permission factory that check OAuth2 scope and can_method.
 
@@ -79,9 +189,19 @@ def check_oauth2_scope(can_method, *myscopes):
 def can_elasticsearch(record):
     """Check if a given record is indexed.
 
+    Unless ``DEPOSIT_PERMISSION_CHECK_ELASTICSEARCH`` is enabled, the deposit
+    is not looked up in Elasticsearch: as the default deposit search filter
+    (see :func:`invenio_deposit.search.deposits_filter`), the current user
+    must be one of the owners of the deposit or an admin.
+
     :param record: A record object.
     :returns: If the record is indexed returns `True`, otherwise `False`.
     """
+    if not current_app.config['DEPOSIT_PERMISSION_CHECK_ELASTICSEARCH']:
+        owners = record.get('_deposit', {}).get('owners', [])
+        return getattr(current_user, 'id', 0) in owners or \
+            admin_permission_factory().can()
+
     search = request._methodview.search_class()
     search = search.get_record(str(record.id))
     return search.count() == 1
@@ -10,33 +10,57 @@
 
 from __future__ import absolute_import, print_function
 
+import base64
+import hashlib
 import json
+import shutil
+import tarfile
+import tempfile
+import zipfile
 from copy import deepcopy
 from functools import partial
 
 from flask import Blueprint, abort, current_app, make_response, request, \
     url_for
 from invenio_db import db
+from invenio_files_rest.errors import MissingQueryParameter, \
+    MultipartInvalidChunkSize
+from invenio_files_rest.models import MultipartObject, ObjectVersion, Part
+from invenio_files_rest.proxies import current_files_rest
+from invenio_files_rest.tasks import remove_file_data
 from invenio_oauth2server import require_api_auth, require_oauth_scopes
 from invenio_pidstore.errors import PIDInvalidAction
+from invenio_records.api import Record
+from invenio_records_rest.errors import SearchPaginationRESTError
+from invenio_records_rest.proxies import current_records_rest
+from invenio_records_rest.serializers.response import add_link_header
 from invenio_records_rest.utils import obj_or_import_string
+from invenio_records_rest.views import RecordResource, RecordsListResource
 from invenio_records_rest.views import \
     create_error_handlers as records_rest_error_handlers
 from invenio_records_rest.views import \
     create_url_rules as records_rest_url_rules
-from invenio_records_rest.views import need_record_permission, pass_record
+from invenio_records_rest.views import need_record_permission, pass_record, \
+    use_paginate_args
 from invenio_rest import ContentNegotiatedMethodView
 from invenio_rest.views import create_api_errorhandler
-from webargs import fields
+from sqlalchemy.orm import joinedload
+from webargs import fields, missing, validate
 from webargs.flaskparser import use_kwargs
+from werkzeug.exceptions import HTTPException
 from werkzeug.utils import secure_filename
 
 from ..api import Deposit
-from ..errors import FileAlreadyExists, WrongFile
+from ..cache import dump_response, load_response
+from ..errors import FileAlreadyExists, WrongCursor, WrongFile, \
+    WrongFileOperation
+from ..models import DepositActionJob
 from ..scopes import write_scope
 from ..search import DepositSearch
+from ..serializers import json_job_response
 from ..signals import post_action
-from ..utils import extract_actions_from_class
+from ..tasks import merge_multipart_upload, run_deposit_action
+from ..utils import actions_registry, commit_action, project
 
 
 def create_error_handlers(blueprint):
@@ -100,6 +124,12 @@ def create_blueprint(endpoints):
         options.setdefault('indexer_class', None)
 
         for rule in records_rest_url_rules(endpoint, **options):
+            view_func = rule['view_func']
+            view_class = getattr(view_func, 'view_class', None)
+            if view_class in deposit_view_classes:
+                # the view instantiates its class at each request: serve the
+                # deposits with the resources extending the records ones
+                view_func.view_class = deposit_view_classes[view_class]
             blueprint.add_url_rule(**rule)
 
         search_class_kwargs = {}
@@ -137,7 +167,7 @@ def create_blueprint(endpoints):
         blueprint.add_url_rule(
             '{0}/actions/<any({1}):action>'.format(
                 options['item_route'],
-                ','.join(extract_actions_from_class(record_class)),
+                ','.join(actions_registry[record_class]),
             ),
             view_func=deposit_actions,
             methods=['POST'],
@@ -153,7 +183,7 @@ def create_blueprint(endpoints):
         blueprint.add_url_rule(
             file_list_route,
             view_func=deposit_files,
-            methods=['GET', 'POST', 'PUT'],
+            methods=['GET', 'POST', 'PUT', 'PATCH'],
         )
 
         deposit_file = DepositFileResource.as_view(
@@ -166,11 +196,312 @@ def create_blueprint(endpoints):
         blueprint.add_url_rule(
             file_item_route,
             view_func=deposit_file,
-            methods=['GET', 'PUT', 'DELETE'],
+            methods=['GET', 'POST', 'PUT', 'DELETE'],
+        )
+
+        deposit_job = DepositJobResource.as_view(
+            DepositJobResource.view_name.format(endpoint),
+            serializers={'application/json': json_job_response},
+            pid_type=options['pid_type'],
+            ctx=ctx,
+        )
+
+        blueprint.add_url_rule(
+            '{0}/jobs/<uuid:job_id>'.format(options['item_route']),
+            view_func=deposit_job,
+            methods=['GET'],
         )
     return blueprint
 
 
+def response_cache_key(etag):
+    """Get the key of a response to a deposit read in the response cache.
+
+    The response depends on the state of the deposit, on the URL of the
+    request, for the links and the query parameters, and on the media types
+    accepted by the client.
+
+    :param etag: The ETag of the deposit.
+    :returns: The key of the response.
+    """
+    key = u'\n'.join([etag, request.url, request.headers.get('Accept', '')])
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def request_fields():
+    """Get the fields requested with the ``fields`` query parameter.
+
+    The fields are separated by commas, e.g. ``fields=_deposit.status,title``.
+
+    :returns: The list of fields, or ``None`` if no field is requested.
+    """
+    fields = [field.strip() for value in request.args.getlist('fields')
+              for field in value.split(',') if field.strip()]
+    return fields or None
+
+
+def dump_cursor(sort_values):
+    """Encode the sort values of the last hit of a page in a cursor.
+
+    :param sort_values: The ``sort`` values of the hit.
+    :returns: An opaque URL-safe token.
+    """
+    data = json.dumps(sort_values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def load_cursor(cursor):
+    """Decode a cursor created by :func:`dump_cursor`.
+
+    :param cursor: The token.
+    :returns: The list of sort values, or ``None`` if the token is invalid.
+    """
+    try:
+        data = base64.urlsafe_b64decode(
+            str(cursor) + '=' * (-len(cursor) % 4))
+        sort_values = json.loads(data.decode('utf-8'))
+    except (TypeError, ValueError):
+        return None
+    return sort_values if isinstance(sort_values, list) else None
+
+
+class DepositListResource(RecordsListResource):
+    """Deposit list resource, with cursor pagination.
+
+    The deposits are paginated with ``page`` or ``from``, as the records,
+    unless the ``cursor`` query parameter is given: an empty cursor requests
+    the first page and the ``next`` link carries the cursor of the following
+    page. The pages are fetched with ``search_after``, without the
+    ``max_result_window`` limit and at the same cost at any depth.
+
+    Only the fields requested with the ``fields`` query parameter (see
+    :func:`request_fields`) are fetched from Elasticsearch. Otherwise, if the
+    serializer matching the request has a ``source_includes`` attribute (see
+    :func:`invenio_deposit.serializers.listing_responsify`), only these fields
+    of the deposits are fetched.
+    """
+
+    def source_includes(self):
+        """Get the fields of the deposits fetched from Elasticsearch.
+
+        :returns: The list of fields, or ``None`` for the whole deposits.
+        """
+        fields = request_fields()
+        if fields:
+            # the identifier is needed by the PID fetcher
+            return fields + ['_deposit.id']
+        serializer = self.match_serializers(
+            *self.get_method_serializers('GET'))
+        return getattr(serializer, 'source_includes', None)
+
+    def get(self, **kwargs):
+        """Search deposits.
+
+        Permissions: the `list_permission_factory` permissions are
+            checked.
+        """
+        source_includes = self.source_includes()
+        if source_includes:
+            # the resource is instantiated at each request
+            search_class = self.search_class
+            self.search_class = lambda: search_class().source(
+                includes=source_includes)
+        if 'cursor' in request.args:
+            return self.get_cursor(**kwargs)
+        return super(DepositListResource, self).get(**kwargs)
+
+    @need_record_permission('list_permission_factory')
+    @use_paginate_args(
+        default_size=lambda self: current_app.config.get(
+            'RECORDS_REST_DEFAULT_RESULTS_SIZE', 10),
+        max_results=lambda self: self.max_result_window,
+    )
+    def get_cursor(self, pagination=None, **kwargs):
+        """Search a page of deposits after a cursor.
+
+        :returns: Search result containing hits and aggregations as
+                  returned by invenio-search.
+        """
+        if pagination['from_idx']:
+            raise SearchPaginationRESTError(
+                description='The query parameter cursor must not be used '
+                            'with from or page.')
+        cursor = request.args['cursor']
+
+        search = self.search_class().with_preference_param().params(
+            version=True)[:pagination['size']]
+        search, qs_kwargs = self.search_factory(search)
+        # the deposit id breaks the ties to get a total order of the hits
+        search = search.sort(*(list(search._sort) + ['_deposit.id']))
+        if cursor:
+            sort_values = load_cursor(cursor)
+            if sort_values is None or \
+                    len(sort_values) != len(search._sort):
+                raise SearchPaginationRESTError(
+                    description='Invalid cursor.')
+            search = search.extra(search_after=sort_values)
+
+        search_result = search.execute().to_dict()
+        hits = search_result['hits']['hits']
+
+        endpoint = '.{0}_list'.format(
+            current_records_rest.default_endpoint_prefixes[self.pid_type])
+        urlkwargs = dict(qs_kwargs)
+        urlkwargs.update(size=pagination['size'], _external=True)
+        links = dict(self=url_for(endpoint, cursor=cursor, **urlkwargs))
+        if len(hits) == pagination['size']:
+            links['next'] = url_for(
+                endpoint, cursor=dump_cursor(hits[-1]['sort']), **urlkwargs)
+
+        return self.make_response(
+            pid_fetcher=self.pid_fetcher,
+            search_result=search_result,
+            links=links,
+            item_links_factory=self.item_links_factory,
+        )
+
+
+class DepositResource(RecordResource):
+    """Deposit item resource, with field projection and deposit ETags.
+
+    The deposits read with a ``fields`` query parameter (see
+    :func:`request_fields`) are serialized with the requested fields only.
+
+    The ETag of the responses is the one of the deposit and of its files (see
+    :attr:`invenio_deposit.api.Deposit.etag`), in place of its revision, as
+    the files listed in a deposit can change without a new revision. It is
+    suffixed with a hash of the requested fields and of the negotiated
+    mimetype, see :meth:`representation_etag`.
+    """
+
+    fields = None
+    etag = None
+
+    @pass_record
+    @need_record_permission('read_permission_factory')
+    def get(self, pid, record, **kwargs):
+        """Get a deposit.
+
+        With a matching ``If-None-Match`` or ``If-Modified-Since`` header,
+        the response is a ``304 Not Modified``, and the deposit is not
+        serialized. Otherwise, the response is read from the response cache,
+        if enabled (see :data:`invenio_deposit.config.DEPOSIT_RESPONSE_CACHE`),
+        once the permissions are checked.
+
+        Permissions: ``read_permission_factory``
+
+        :param pid: Persistent identifier for deposit.
+        :param record: The deposit.
+        :returns: The requested deposit.
+        """
+        # the resource is instantiated at each request
+        self.fields = request_fields()
+        self.etag = self.representation_etag(record.etag)
+        self.check_etag(self.etag)
+        if request.if_modified_since:
+            self.check_if_modified_since(record.last_modified, etag=self.etag)
+
+        cache = current_app.extensions['invenio-deposit-rest'].response_cache
+        if cache is not None:
+            key = response_cache_key(self.etag)
+            cached = cache.get(str(record.id), key)
+            if cached is not None:
+                return load_response(cached)
+
+        response = self.make_response(
+            pid, record, links_factory=self.links_factory
+        )
+        if cache is not None and response.status_code == 200:
+            cache.set(str(record.id), key, dump_response(response))
+        return response
+
+    def check_etag(self, etag, weak=False):
+        """Validate the given ETag with current request conditions.
+
+        The updates of a deposit are also accepted with the ETag of the
+        deposit read with a GET request in the ``If-Match`` header, whatever
+        its fields and mimetype.
+
+        :param etag: The ETag of the deposit.
+        :param weak: Compare weak ETags. (Default: ``False``)
+        """
+        if request.method in ('PUT', 'PATCH') and \
+                request.if_match.as_set() and etag not in request.if_match:
+            _, record = request.view_args['pid_value'].data
+            for match in request.if_match.as_set():
+                if match.split('-')[0] == record.etag:
+                    etag = match
+                    break
+        super(DepositResource, self).check_etag(etag, weak=weak)
+
+    def representation_etag(self, etag):
+        """Get the ETag of the deposit serialized for the current request.
+
+        The deposit ETag is suffixed with a hash of the requested fields and
+        of the mimetype of the serializer matching the request, as they
+        change the response.
+
+        :param etag: The ETag of the deposit.
+        :returns: The ETag of the response.
+        """
+        serializers, default_media_type = self.get_method_serializers(
+            request.method)
+        serializer = self.match_serializers(serializers, default_media_type)
+        mimetype = next((mimetype for mimetype in sorted(serializers)
+                         if serializers[mimetype] is serializer), '')
+        variant = u'{0}\n{1}'.format(mimetype, u','.join(self.fields or ()))
+        return u'{0}-{1}'.format(
+            etag, hashlib.md5(variant.encode('utf-8')).hexdigest()[:8])
+
+    def make_response(self, pid, record, *args, **kwargs):
+        """Create a Flask Response, with the requested fields of the deposit.
+
+        The selected fields are copied from the deposit, without dumping it,
+        e.g. the files of the bucket are only listed if ``_files`` is
+        requested.
+
+        :param pid: Persistent identifier of the deposit.
+        :param record: The deposit.
+        :returns: The response created by the serializer.
+        """
+        etag = self.etag
+        if etag is None and hasattr(record, 'etag'):
+            etag = self.representation_etag(record.etag)
+        if self.fields:
+            data = record.dumps() if any(
+                field.split('.')[0] == '_files' for field in self.fields
+            ) else record
+            record = Record(project(data, self.fields), model=record.model)
+        response = super(DepositResource, self).make_response(
+            pid, record, *args, **kwargs)
+        if etag is not None:
+            response.set_etag(etag)
+            response.vary.add('Accept')
+        return response
+
+
+deposit_view_classes = {
+    RecordsListResource: DepositListResource,
+    RecordResource: DepositResource,
+}
+"""Deposit resources used in place of the records resources."""
+
+
+def job_links(pid, job):
+    """Links of a deposit action job.
+
+    :param pid: The deposit PID.
+    :param job: A :class:`invenio_deposit.models.DepositActionJob` instance.
+    :returns: A dictionary with the job and deposit URLs.
+    """
+    return dict(
+        self=url_for('.{0}_job'.format(pid.pid_type), pid_value=pid.pid_value,
+                     job_id=job.id, _external=True),
+        deposit=url_for('.{0}_item'.format(pid.pid_type),
+                        pid_value=pid.pid_value, _external=True),
+    )
+
+
 class DepositActionResource(ContentNegotiatedMethodView):
     """Deposit action resource."""
 
@@ -197,16 +528,21 @@ class DepositActionResource(ContentNegotiatedMethodView):
 
         Permission required: `update_permission_factory`.
 
+        The actions listed in
+        :data:`invenio_deposit.config.DEPOSIT_ASYNC_ACTIONS` are instead run
+        by a Celery task: the response is a ``202 Accepted`` with the job
+        reporting their progress.
+
         :param pid: Pid object (from url).
         :param record: Record object resolved from the pid.
         :param action: The action to execute.
         """
+        if action in current_app.config['DEPOSIT_ASYNC_ACTIONS']:
+            return self.enqueue(pid, action)
+
         record = getattr(record, action)(pid=pid)
 
-        db.session.commit()
-        # Refresh the PID and record metadata
-        db.session.refresh(pid)
-        db.session.refresh(record.model)
+        commit_action()
         post_action.send(current_app._get_current_object(), action=action,
                          pid=pid, deposit=record)
         response = self.make_response(pid, record,
@@ -216,12 +552,119 @@ class DepositActionResource(ContentNegotiatedMethodView):
         response.headers.extend(dict(Location=location))
         return response
 
+    def enqueue(self, pid, action):
+        """Enqueue a deposit action.
+
+        :param pid: Pid object (from url).
+        :param action: The action to execute.
+        """
+        job = DepositActionJob.create(pid, action)
+        db.session.commit()
+        run_deposit_action.delay(str(job.id))
+
+        links = job_links(pid, job)
+        response = json_job_response(job, links=links, status=202)
+        response.headers.extend(dict(Location=links['self']))
+        return response
+
+
+ZIP_MIMETYPES = ('application/zip', 'application/x-zip-compressed')
+"""Request body types read as a zip archive by a batch upload."""
+
+TAR_MIMETYPES = ('application/x-tar', 'application/gzip',
+                 'application/x-gzip', 'application/x-bzip2')
+"""Request body types read as a tar archive by a batch upload."""
+
+
+def uploaded_files():
+    """Iterate over the files sent in the request body of a batch upload.
+
+    The body is either a multipart form with any number of files, or a tar
+    or zip archive whose regular files are read one by one.
+
+    :returns: An iterator of file name and stream pairs.
+    :raises invenio_deposit.errors.WrongFile: If the archive is not valid.
+    """
+    try:
+        if request.mimetype in ZIP_MIMETYPES:
+            # A zip archive can only be read from a seekable file.
+            with tempfile.TemporaryFile() as archive:
+                shutil.copyfileobj(request.stream, archive)
+                with zipfile.ZipFile(archive) as zip_:
+                    for info in zip_.infolist():
+                        if not info.filename.endswith('/'):
+                            with zip_.open(info) as stream:
+                                yield info.filename, stream
+        elif request.mimetype in TAR_MIMETYPES:
+            with tarfile.open(fileobj=request.stream, mode='r|*') as tar:
+                for member in tar:
+                    if member.isfile():
+                        yield member.name, tar.extractfile(member)
+        else:
+            for _, storage in request.files.items(multi=True):
+                yield storage.filename, storage.stream
+    except (zipfile.BadZipfile, tarfile.TarError):
+        raise WrongFile()
+
+
+class DepositJobResource(ContentNegotiatedMethodView):
+    """Deposit action job resource."""
+
+    view_name = '{0}_job'
+
+    def __init__(self, serializers, pid_type, ctx, *args, **kwargs):
+        """Constructor."""
+        super(DepositJobResource, self).__init__(
+            serializers,
+            *args,
+            **kwargs
+        )
+        for key, value in ctx.items():
+            setattr(self, key, value)
+
+    @pass_record
+    @need_record_permission('read_permission_factory')
+    def get(self, pid, record, job_id):
+        """Get the state of a deposit action run asynchronously.
+
+        Permission required: `read_permission_factory`.
+
+        :param pid: Pid object (from url).
+        :param record: Record object resolved from the pid.
+        :param job_id: The job identifier.
+        :returns: The job.
+        """
+        job = DepositActionJob.query.filter_by(
+            id=job_id, pid_type=pid.pid_type, pid_value=pid.pid_value,
+        ).one_or_none() or abort(404)
+        return self.make_response(job, links=job_links(pid, job))
+
 
 class DepositFilesResource(ContentNegotiatedMethodView):
     """Deposit files resource."""
 
     view_name = '{0}_files'
 
+    get_args = dict(
+        limit=fields.Int(
+            location='query',
+            validate=validate.Range(min=1),
+            missing=None,
+        ),
+        cursor=fields.Str(
+            location='query',
+            missing=None,
+        ),
+    )
+    """GET query arguments."""
+
+    post_args = dict(
+        batch=fields.Raw(
+            location='query',
+        ),
+    )
+    """POST query arguments."""
+
     def __init__(self, serializers, pid_type, ctx, *args, **kwargs):
         """Constructor."""
         super(DepositFilesResource, self).__init__(
@@ -232,31 +675,111 @@ class DepositFilesResource(ContentNegotiatedMethodView):
         for key, value in ctx.items():
             setattr(self, key, value)
 
+    @use_kwargs(get_args)
     @pass_record
     @need_record_permission('read_permission_factory')
-    def get(self, pid, record):
+    def get(self, pid, record, limit=None, cursor=None):
         """Get files.
 
+        The response has the ETag of the deposit (see
+        :attr:`invenio_deposit.api.Deposit.etag`): with a matching
+        ``If-None-Match`` header, the files are not listed and the response is
+        a ``304 Not Modified``.
+
+        With ``?limit``, only the first ``limit`` files are listed by key, and
+        the ``next`` link of the ``Link`` header lists the following files,
+        with a ``cursor`` query parameter.
+
         Permission required: `read_permission_factory`.
 
         :param pid: Pid object (from url).
         :param record: Record object resolved from the pid.
+        :param limit: The number of files listed. (Default: ``None``)
+        :param cursor: The cursor of the page of files. (Default: ``None``)
         :returns: The files.
         """
-        return self.make_response(obj=record.files, pid=pid, record=record)
+        etag = record.etag
+        self.check_etag(etag)
+
+        files = record.files
+        links = {}
+        if limit is not None:
+            after = None
+            if cursor is not None:
+                after = load_cursor(cursor)
+                if not after or len(after) != 1:
+                    raise WrongCursor()
+                after = after[0]
+            last = files.page(limit, after=after)
+            endpoint = '.{0}_files'.format(pid.pid_type)
+            links['self'] = url_for(
+                endpoint, pid_value=pid.pid_value, limit=limit,
+                cursor=cursor, _external=True)
+            if last is not None:
+                links['next'] = url_for(
+                    endpoint, pid_value=pid.pid_value, limit=limit,
+                    cursor=dump_cursor([last]), _external=True)
+
+        response = self.make_response(obj=files, pid=pid, record=record)
+        response.set_etag(etag)
+        if links:
+            add_link_header(response, links)
+        return response
+
+    def batch_upload(self, pid, record):
+        """Add many files to the deposit.
+
+        The files are written into the bucket in a single transaction. A file
+        which can not be added, e.g. because its name is already taken, is
+        reported with its error and does not prevent adding the others.
+
+        :param pid: Pid object (from url).
+        :param record: Record object resolved from the pid.
+        """
+        bucket = record.files.bucket
+        keys = set(obj.key for obj in ObjectVersion.get_by_bucket(bucket))
+        results = []
+        for filename, stream in uploaded_files():
+            key = secure_filename(filename or '')
+            try:
+                if not key:
+                    raise WrongFile()
+                if key in keys:
+                    raise FileAlreadyExists()
+                with db.session.begin_nested():
+                    obj = ObjectVersion.create(bucket, key, stream=stream)
+                keys.add(key)
+                results.append((key, obj, None))
+            except HTTPException as e:
+                results.append((key or filename, None, e))
+        added = any(error is None for _, _, error in results)
+        if added:
+            record.reindex()
+            db.session.commit()
+        return self.make_response(
+            obj=results, pid=pid, record=record, status=201 if added else 400)
 
+    @use_kwargs(post_args)
     @require_api_auth()
     @require_oauth_scopes(write_scope.id)
     @pass_record
     @need_record_permission('update_permission_factory')
-    def post(self, pid, record):
+    def post(self, pid, record, batch=missing):
         """Handle POST deposit files.
 
+        With ``?batch``, add many files at once, see :meth:`batch_upload`.
+        They are sent either as a multipart form with any number of files or
+        as a tar (``application/x-tar``, optionally compressed) or zip
+        (``application/zip``) archive.
+
         Permission required: `update_permission_factory`.
 
         :param pid: Pid object (from url).
         :param record: Record object resolved from the pid.
+        :param batch: Present for a batch upload.
         """
+        if batch is not missing:
+            return self.batch_upload(pid, record)
         # load the file
         uploaded_file = request.files['file']
         # file name
@@ -268,7 +791,7 @@ class DepositFilesResource(ContentNegotiatedMethodView):
             raise FileAlreadyExists()
         # add it to the deposit
         record.files[key] = uploaded_file.stream
-        record.commit()
+        record.reindex()
         db.session.commit()
         return self.make_response(
             obj=record.files[key].obj, pid=pid, record=record, status=201)
@@ -311,13 +834,97 @@ class DepositFilesResource(ContentNegotiatedMethodView):
         db.session.commit()
         return self.make_response(obj=record.files, pid=pid, record=record)
 
+    @require_api_auth()
+    @require_oauth_scopes(write_scope.id)
+    @pass_record
+    @need_record_permission('update_permission_factory')
+    def patch(self, pid, record):
+        """Handle the rename and delete of many files at once.
+
+        Expected input in body PATCH:
+
+        .. code-block:: javascript
+
+            [
+                {
+                    "op": "rename",
+                    "filename": "old.txt",
+                    "new_filename": "new.txt"
+                },
+                {
+                    "op": "delete",
+                    "filename": "unused.txt"
+                },
+                ...
+            ]
+
+        The operations are applied in order, in a single transaction: if one
+        fails, none is applied. The deposit is committed and reindexed once.
+
+        Permission required: `update_permission_factory`.
+
+        :param pid: Pid object (from url).
+        :param record: Record object resolved from the pid.
+        :returns: The files.
+        """
+        try:
+            ops = json.loads(request.data.decode('utf-8'))
+            assert isinstance(ops, list)
+        except (ValueError, AssertionError):
+            raise WrongFile()
+        for index, op in enumerate(ops):
+            if not isinstance(op, dict) or \
+                    op.get('op') not in ('rename', 'delete'):
+                raise WrongFileOperation(index, 'Unknown operation.')
+            names = ['filename', 'new_filename'] if op['op'] == 'rename' \
+                else ['filename']
+            # the JSON strings are decoded as text, also on Python 2
+            if not all(isinstance(op.get(name), type(u''))
+                       for name in names):
+                raise WrongFileOperation(index, 'Wrong file name.')
+
+        bucket = record.files.bucket
+        heads = {
+            obj.key: obj for obj in ObjectVersion.get_by_bucket(
+                bucket).options(joinedload(ObjectVersion.file))
+        }
+        with db.session.begin_nested():
+            for index, op in enumerate(ops):
+                obj = heads.pop(op['filename'], None)
+                if obj is None:
+                    raise WrongFileOperation(index, 'File not found.')
+                if op['op'] == 'rename':
+                    new_key = op['new_filename']
+                    if not new_key or new_key != secure_filename(new_key):
+                        raise WrongFileOperation(index, 'Wrong new file name.')
+                    if new_key in heads:
+                        raise WrongFileOperation(
+                            index, 'Filename already exists.')
+                    heads[new_key] = ObjectVersion.create(
+                        bucket, new_key, _file_id=obj.file)
+                ObjectVersion.create(bucket, obj.key)
+
+        record.commit()
+        db.session.commit()
+        return self.make_response(obj=record.files, pid=pid, record=record)
+
 
 class DepositFileResource(ContentNegotiatedMethodView):
     """Deposit files resource."""
 
     view_name = '{0}_file'
 
+    upload_args = dict(
+        upload_id=fields.UUID(
+            location='query',
+            load_from='uploadId',
+            missing=None,
+        ),
+    )
+    """Chunked upload query arguments."""
+
     get_args = dict(
+        upload_args,
         version_id=fields.UUID(
             location='headers',
             load_from='version_id',
@@ -325,6 +932,23 @@ class DepositFileResource(ContentNegotiatedMethodView):
     )
     """GET query arguments."""
 
+    post_args = dict(
+        upload_args,
+        uploads=fields.Raw(
+            location='query',
+        ),
+        size=fields.Int(
+            location='query',
+            missing=None,
+        ),
+        part_size=fields.Int(
+            location='query',
+            load_from='partSize',
+            missing=None,
+        ),
+    )
+    """POST query arguments."""
+
     def __init__(self, serializers, pid_type, ctx, *args, **kwargs):
         """Constructor."""
         super(DepositFileResource, self).__init__(
@@ -335,11 +959,120 @@ class DepositFileResource(ContentNegotiatedMethodView):
         for key, value in ctx.items():
             setattr(self, key, value)
 
+    def get_multipart(self, record, key, upload_id):
+        """Get an ongoing chunked upload of a file.
+
+        :param record: Record object resolved from the pid.
+        :param key: Unique identifier for the file in the deposit.
+        :param upload_id: The upload identifier.
+        :returns: A :class:`invenio_files_rest.models.MultipartObject`
+            instance.
+        """
+        files = record.files
+        if files is None:
+            abort(404)
+        return MultipartObject.get(
+            files.bucket, str(key), upload_id) or abort(404)
+
+    def multipart_init(self, pid, record, key, size=None, part_size=None):
+        """Start a chunked upload of a file.
+
+        :param pid: Pid object (from url).
+        :param record: Record object resolved from the pid.
+        :param key: Unique identifier for the file in the deposit.
+        :param size: The total size of the file.
+        :param part_size: The size of each part, except the last one.
+        """
+        if size is None:
+            raise MissingQueryParameter('size')
+        if part_size is None:
+            raise MissingQueryParameter('partSize')
+        key = str(key)
+        if key != secure_filename(key):
+            raise WrongFile()
+        files = record.files
+        if files is None:
+            abort(404)
+        if key in files or MultipartObject.query.filter_by(
+                bucket_id=files.bucket.id, key=key, completed=True).count():
+            raise FileAlreadyExists()
+        multipart = MultipartObject.create(files.bucket, key, size, part_size)
+        db.session.commit()
+        return self.make_response(
+            obj=multipart, pid=pid, record=record, status=201)
+
+    def multipart_uploadpart(self, pid, record, multipart):
+        """Upload a part of a chunked upload.
+
+        The part is streamed from the request body into the file, at the
+        offset given by its number, and its checksum is computed on the way.
+        Parts can be uploaded in parallel and uploaded again if they fail.
+
+        :param pid: Pid object (from url).
+        :param record: Record object resolved from the pid.
+        :param multipart: The chunked upload.
+        """
+        content_length, part_number, stream, _, _, _ = \
+            current_files_rest.multipart_partfactory()
+
+        if content_length:
+            expected = multipart.last_part_size \
+                if part_number == multipart.last_part_number \
+                else multipart.chunk_size
+            if content_length != expected:
+                raise MultipartInvalidChunkSize()
+
+        try:
+            part = Part.get_or_create(multipart, part_number)
+            part.set_contents(stream)
+            db.session.commit()
+        except Exception:
+            # Incomplete data may have been written: the part must be
+            # uploaded again.
+            db.session.rollback()
+            Part.delete(multipart, part_number)
+            db.session.commit()
+            raise
+        return self.make_response(obj=part, pid=pid, record=record)
+
+    def multipart_complete(self, pid, record, multipart):
+        """Complete a chunked upload.
+
+        The file is added to the deposit by the
+        :func:`invenio_deposit.tasks.merge_multipart_upload` task, as
+        computing its checksum reads the whole file.
+
+        :param pid: Pid object (from url).
+        :param record: Record object resolved from the pid.
+        :param multipart: The chunked upload.
+        """
+        multipart.complete()
+        db.session.commit()
+        response = self.make_response(
+            obj=multipart, pid=pid, record=record, status=202)
+        merge_multipart_upload.delay(
+            str(multipart.upload_id), str(record.id), pid_type=pid.pid_type)
+        return response
+
+    def multipart_delete(self, pid, record, multipart):
+        """Abort a chunked upload.
+
+        :param pid: Pid object (from url).
+        :param record: Record object resolved from the pid.
+        :param multipart: The chunked upload.
+        """
+        file_id = multipart.file_id
+        multipart.delete()
+        db.session.commit()
+        remove_file_data.delay(str(file_id))
+        return make_response('', 204)
+
     @use_kwargs(get_args)
     @pass_record
     @need_record_permission('read_permission_factory')
-    def get(self, pid, record, key, version_id=None, **kwargs):
-        """Get file.
+    def get(self, pid, record, key, version_id=None, upload_id=None,
+            **kwargs):
+        """Get file or the state of a chunked upload.
 
         Permission required: `read_permission_factory`.
 
@@ -348,8 +1081,14 @@ class DepositFileResource(ContentNegotiatedMethodView):
         :param key: Unique identifier for the file in the deposit.
         :param version_id: File version. Optional. If no version is provided,
             the last version is retrieved.
+        :param upload_id: The identifier of a chunked upload. If given, the
+            upload with its uploaded parts is returned.
         :returns: the file content.
         """
+        if upload_id:
+            return self.make_response(
+                obj=self.get_multipart(record, key, upload_id),
+                pid=pid, record=record)
         try:
             obj = record.files[str(key)].get_version(version_id=version_id)
             return self.make_response(
@@ -357,19 +1096,65 @@ class DepositFileResource(ContentNegotiatedMethodView):
         except KeyError:
             abort(404)
 
+    @use_kwargs(post_args)
     @require_api_auth()
     @require_oauth_scopes(write_scope.id)
     @pass_record
     @need_record_permission('update_permission_factory')
-    def put(self, pid, record, key):
+    def post(self, pid, record, key, uploads=missing, upload_id=None,
+             size=None, part_size=None):
+        """Start or complete a chunked upload of a file.
+
+        * ``POST ?uploads&size=<size>&partSize=<part size>`` starts the
+          upload and returns its ``upload_id``.
+        * ``PUT ?uploadId=<upload id>&partNumber=<n>`` uploads the bytes from
+          ``n * partSize``, see :meth:`put`.
+        * ``GET ?uploadId=<upload id>`` lists the uploaded parts, e.g. to
+          resume an interrupted upload.
+        * ``POST ?uploadId=<upload id>`` completes the upload and replies
+          ``202 Accepted``: the file is added to the deposit in the
+          background. Until then, ``GET ?uploadId=<upload id>`` returns the
+          completed upload, then ``404 Not Found``.
+        * ``DELETE ?uploadId=<upload id>`` aborts it.
+
+        Permission required: `update_permission_factory`.
+
+        :param pid: Pid object (from url).
+        :param record: Record object resolved from the pid.
+        :param key: Unique identifier for the file in the deposit.
+        :param uploads: Present to start an upload.
+        :param upload_id: The identifier of the upload to complete.
+        :param size: The total size of the file.
+        :param part_size: The size of each part, except the last one.
+        """
+        if uploads is not missing:
+            return self.multipart_init(
+                pid, record, key, size=size, part_size=part_size)
+        if upload_id:
+            return self.multipart_complete(
+                pid, record, self.get_multipart(record, key, upload_id))
+        abort(400)
+
+    @use_kwargs(upload_args)
+    @require_api_auth()
+    @require_oauth_scopes(write_scope.id)
+    @pass_record
+    @need_record_permission('update_permission_factory')
+    def put(self, pid, record, key, upload_id=None):
         """Handle the file rename through the PUT deposit file.
 
+        With an ``uploadId``, upload a part of a chunked upload instead.
+
         Permission required: `update_permission_factory`.
 
         :param pid: Pid object (from url).
         :param record: Record object resolved from the pid.
         :param key: Unique identifier for the file in the deposit.
+        :param upload_id: The identifier of a chunked upload.
         """
+        if upload_id:
+            return self.multipart_uploadpart(
+                pid, record, self.get_multipart(record, key, upload_id))
         try:
             data = json.loads(request.data.decode('utf-8'))
             new_key = data['filename']
@@ -382,26 +1167,33 @@ class DepositFileResource(ContentNegotiatedMethodView):
             obj = record.files.rename(str(key), new_key_secure)
         except KeyError:
             abort(404)
-        record.commit()
+        record.reindex()
         db.session.commit()
         return self.make_response(obj=obj, pid=pid, record=record)
 
+    @use_kwargs(upload_args)
     @require_api_auth()
     @require_oauth_scopes(write_scope.id)
     @pass_record
     @need_record_permission('update_permission_factory')
-    def delete(self, pid, record, key):
+    def delete(self, pid, record, key, upload_id=None):
         """Handle DELETE deposit file.
 
+        With an ``uploadId``, abort a chunked upload instead.
+
         Permission required: `update_permission_factory`.
 
         :param pid: Pid object (from url).
         :param record: Record object resolved from the pid.
         :param key: Unique identifier for the file in the deposit.
+        :param upload_id: The identifier of a chunked upload.
         """
+        if upload_id:
+            return self.multipart_delete(
+                pid, record, self.get_multipart(record, key, upload_id))
         try:
             del record.files[str(key)]
-            record.commit()
+            record.reindex()
             db.session.commit()
             return make_response('', 204)
         except KeyError:
@@ -47,6 +47,9 @@ extras_require = {
     'elasticsearch7': [
         'invenio-search[elasticsearch7]>={}'.format(invenio_search_version),
     ],
+    'redis': [
+        'redis>=2.10.0',
+    ],
     'tests': tests_require,
 }
 
@@ -115,6 +118,15 @@ setup(
         'invenio_base.api_apps': [
             'invenio_deposit_rest = invenio_deposit:InvenioDepositREST',
         ],
+        'invenio_celery.tasks': [
+            'invenio_deposit = invenio_deposit.tasks',
+        ],
+        'invenio_db.alembic': [
+            'invenio_deposit = invenio_deposit:alembic',
+        ],
+        'invenio_db.models': [
+            'invenio_deposit = invenio_deposit.models',
+        ],
         'invenio_access.actions': [
             'deposit_admin_access'
             ' = invenio_deposit.permissions:action_admin_access',
@@ -10,18 +10,32 @@
 
 from __future__ import absolute_import, print_function
 
+import re
 from copy import deepcopy
 
 import pytest
+from elasticsearch.exceptions import ConflictError
+from flask import current_app
+from flask_login import login_user
+from flask_principal import Identity, identity_changed
 from invenio_db import db
+from invenio_files_rest.errors import InvalidOperationError
+from invenio_indexer.signals import before_record_index
 from invenio_pidstore.errors import PIDInvalidAction
 from invenio_records.errors import MissingModelError
+from invenio_records.signals import before_record_update
+from invenio_search import current_search, current_search_client
 from jsonschema.exceptions import RefResolutionError
 from six import BytesIO
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm.exc import NoResultFound
 
 from invenio_deposit.api import Deposit
 from invenio_deposit.errors import MergeConflict
+from invenio_deposit.merge import merge
+from invenio_deposit.models import DepositIndexOutbox
+from invenio_deposit.search import DepositSearch
 
 
 def test_schemas(app, fake_schemas, location):
@@ -102,6 +116,35 @@ def test_simple_flow(app, fake_schemas, location):
     assert record_json == record.model.json
 
 
+def test_commit_unchanged(app, fake_schemas, location):
+    """Test a deposit without changes is not stored nor indexed again."""
+    deposit = Deposit.create({'title': 'first', 'meta': {'value': 1}})
+    db.session.commit()
+    updates = []
+
+    def record_update(sender, record=None, **kwargs):
+        updates.append(record.id)
+
+    with before_record_update.connected_to(record_update), \
+            before_record_index.connected_to(record_update):
+        deposit = Deposit.get_record(deposit.id)
+        data = deepcopy(deposit.dumps())
+        deposit.clear()
+        deposit.update(data)
+        deposit.commit()
+        db.session.commit()
+        assert 0 == deposit.revision_id
+        assert [] == updates
+
+        deposit = Deposit.get_record(deposit.id)
+        deposit['meta']['value'] = 2
+        deposit.commit()
+        db.session.commit()
+        assert 1 == deposit.revision_id
+        assert [deposit.id] * 2 == updates
+    assert 2 == Deposit.get_record(deposit.id)['meta']['value']
+
+
 def test_delete(app, fake_schemas, location):
     """Test simple delete."""
     deposit = Deposit.create({})
@@ -184,6 +227,48 @@ def test_files_property(app, fake_schemas, location):
     assert 'hello.txt' in deposit.files
 
 
+def test_reindex_on_commit(app, fake_schemas, location):
+    """Test the deposits reindexed once per transaction."""
+    deposit = Deposit.create({})
+    db.session.commit()
+    indexed = []
+
+    def receiver(sender, record=None, **kwargs):
+        indexed.append(record.id)
+
+    with before_record_index.connected_to(receiver):
+        deposit.files['a.txt'] = BytesIO(b'a')
+        deposit.reindex()
+        deposit.files.rename('a.txt', 'b.txt')
+        deposit.reindex()
+        assert [] == indexed
+        db.session.commit()
+    assert [deposit.id] == indexed
+
+def test_files_metadata_renamed(app, fake_schemas, location):
+    """Test the metadata of the files renamed over a deleted file."""
+    deposit = Deposit.create({})
+    deposit.files['a.txt'] = BytesIO(b'a')
+    deposit.files['b.txt'] = BytesIO(b'b')
+    deposit['_files'] = [dict(f.dumps(), description=f.key)
+                         for f in deposit.files]
+    deposit.commit()
+    db.session.commit()
+
+    del deposit.files['a.txt']
+    deposit.files.rename('b.txt', 'a.txt')
+    deposit.commit()
+    db.session.commit()
+    assert [('a.txt', 'b.txt')] == [
+        (f['key'], f['description']) for f in deposit['_files']]
+
+    # the files of a published deposit can not be renamed
+    deposit.publish()
+    db.session.commit()
+    with pytest.raises(InvalidOperationError):
+        deposit.files.rename('a.txt', 'c.txt')
+
+
 def test_publish_revision_changed_mergeable(app, location, fake_schemas):
     """Try to Publish and someone change the deposit in the while."""
     # create a deposit
@@ -250,3 +335,363 @@ def test_publish_revision_changed_not_mergeable(app, location,
     deposit.commit()
     with pytest.raises(MergeConflict):
         deposit.publish()
+
+
+def test_merge():
+    """Test the three-way merge of the deposits."""
+    lca = {
+        'title': 'title', 'keywords': ['a', 'b'],
+        'authors': [{'id': 1, 'name': 'A'}, {'id': 2, 'name': 'B'}],
+        'meta': {'x': 1, 'y': 1},
+    }
+    first = deepcopy(lca)
+    second = deepcopy(lca)
+    first['meta']['x'] = 2
+    first['keywords'][0] = 'x'
+    first['authors'][0]['name'] = 'AA'
+    first['authors'].append({'id': 3, 'name': 'C'})
+    second['meta']['y'] = 2
+    second['keywords'].append('c')
+    del second['authors'][1]
+    second['authors'].insert(0, {'id': 4, 'name': 'D'})
+    del second['title']
+
+    merged = merge(lca, first, second, {'authors': 'id'})
+    assert merged == {
+        'keywords': ['x', 'b', 'c'],
+        'authors': [{'id': 4, 'name': 'D'}, {'id': 1, 'name': 'AA'},
+                    {'id': 3, 'name': 'C'}],
+        'meta': {'x': 2, 'y': 2},
+    }
+    assert merged['meta'] is not first['meta']
+    assert lca['meta'] == {'x': 1, 'y': 1}
+    # the same change on both sides
+    assert merge(lca, first, first) == first
+    # the authors are merged by position without identity key
+    with pytest.raises(MergeConflict):
+        merge(lca, first, second)
+    # the same author modified on both sides
+    second = deepcopy(lca)
+    second['authors'][0]['name'] = 'AB'
+    with pytest.raises(MergeConflict):
+        merge(lca, first, second, {'authors': 'id'})
+    # an author modified and removed
+    del second['authors'][0]
+    with pytest.raises(MergeConflict):
+        merge(lca, first, second, {'authors': 'id'})
+    # the authors moved on both sides in the same way
+    first = deepcopy(lca)
+    first['authors'].reverse()
+    second = deepcopy(lca)
+    second['authors'].append(second['authors'].pop(0))
+    second['authors'][0]['name'] = 'BB'
+    assert merge(lca, first, second, {'authors': 'id'})['authors'] == [
+        {'id': 2, 'name': 'BB'}, {'id': 1, 'name': 'A'}]
+    # the authors moved on both sides in different ways
+    lca = {'authors': [{'id': 1}, {'id': 2}, {'id': 3}]}
+    first = {'authors': [{'id': 2}, {'id': 1}, {'id': 3}]}
+    second = {'authors': [{'id': 1}, {'id': 3}, {'id': 2}]}
+    with pytest.raises(MergeConflict):
+        merge(lca, first, second, {'authors': 'id'})
+
+
+def test_publish_revision_changed_merge_list_keys(app, location,
+                                                  fake_schemas):
+    """Test the merge of lists by identity key on publishing."""
+    current_app.config['DEPOSIT_MERGE_LIST_KEYS'] = {'metadata.authors': 'id'}
+    deposit = Deposit.create({'metadata': {'authors': [
+        {'id': 1, 'name': 'A'}, {'id': 2, 'name': 'B'}]}})
+    deposit.publish()
+    db.session.commit()
+    deposit = deposit.edit()
+    db.session.commit()
+    _, record = deposit.fetch_published()
+    record['metadata']['authors'][1]['name'] = 'BB'
+    record.commit()
+    db.session.commit()
+    deposit['metadata']['authors'].insert(0, {'id': 3, 'name': 'C'})
+    deposit.commit()
+    deposit.publish()
+    db.session.commit()
+    _, record = deposit.fetch_published()
+    assert record['metadata']['authors'] == [
+        {'id': 3, 'name': 'C'}, {'id': 1, 'name': 'A'},
+        {'id': 2, 'name': 'BB'}]
+
+
+def test_publish_revision_changed_merge_base(app, location, fake_schemas):
+    """Test the merge base is loaded once by query on the versions."""
+    deposit = Deposit.create({'metadata': {'title': 'title-1'}})
+    deposit.publish()
+    db.session.commit()
+    deposit = deposit.edit()
+    db.session.commit()
+    _, record = deposit.fetch_published()
+    record['metadata']['title'] = 'title-2.1'
+    record.commit()
+    db.session.commit()
+    deposit['metadata']['title'] = 'title-2.2'
+    deposit.commit()
+    db.session.commit()
+    statements = []
+
+    def count_queries(conn, cursor, statement, *args):
+        if re.search(r'\sFROM records_metadata_version\b', statement):
+            statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', count_queries)
+    try:
+        for i in range(2):
+            with pytest.raises(MergeConflict):
+                Deposit.get_record(deposit.id).publish()
+            db.session.rollback()
+        assert len(statements) == 1
+    finally:
+        event.remove(Engine, 'before_cursor_execute', count_queries)
+    state = current_app.extensions['invenio-deposit-rest']
+    assert state.merge_bases.get(
+        record.id, deposit['_deposit']['pid']['revision_id']
+    )['metadata'] == {'title': 'title-1'}
+
+
+def test_publish_many(app, fake_schemas, location):
+    """Test bulk publishing with per-deposit errors."""
+    deposits = [Deposit.create({'title': str(i)}) for i in range(5)]
+    deposits[2].publish()
+    db.session.commit()
+
+    results = Deposit.publish_many(deposits, chunk_size=2)
+    assert [d.id for d, _ in results] == [d.id for d in deposits]
+    assert isinstance(results[2][1], PIDInvalidAction)
+    for i, (deposit, error) in enumerate(results):
+        if i == 2:
+            continue
+        assert error is None
+        deposit = Deposit.get_record(deposit.id)
+        assert 'published' == deposit.status
+        _, record = deposit.fetch_published()
+        assert str(i) == record['title']
+
+
+def test_publish_many_indexing(app, fake_schemas, location):
+    """Test the deposits indexed after a bulk publishing with errors."""
+    def indexed_status(deposit):
+        current_search.flush_and_refresh('deposits')
+        hits = DepositSearch().get_record(str(deposit.id)).execute()
+        return hits[0]['_deposit']['status'] if hits else None
+
+    deposits = [Deposit.create({'title': str(i)}) for i in range(3)]
+    # fails while publishing, once its status is changed
+    deposits[1]['_deposit']['pid'] = {
+        'type': 'recid', 'value': 'missing', 'revision_id': 0}
+    deposits[1].commit()
+    db.session.commit()
+
+    results = Deposit.publish_many(deposits)
+    assert [error is None for _, error in results] == [True, False, True]
+    # the failed deposit is reported as stored
+    failed = results[1][0]
+    assert failed.id == deposits[1].id
+    assert 'draft' == failed.status
+    assert 'missing' == failed['_deposit']['pid']['value']
+    assert failed.revision_id == Deposit.get_record(failed.id).revision_id
+    assert 'published' == indexed_status(deposits[0])
+    assert 'draft' == indexed_status(deposits[1])
+    assert 'published' == indexed_status(deposits[2])
+    assert 'draft' == Deposit.get_record(deposits[1].id).status
+
+
+def test_publish_many_outbox(app, fake_schemas, location):
+    """Test the bulk publishing through the indexing outbox."""
+    current_app.config['DEPOSIT_INDEXING_OUTBOX'] = True
+    deposits = [Deposit.create({'title': str(i)}) for i in range(2)]
+    db.session.commit()
+    assert (2, 0) == Deposit.indexer.process_outbox(Deposit)
+
+    results = Deposit.publish_many(deposits)
+    assert [None, None] == [error for _, error in results]
+    entries = DepositIndexOutbox.query.order_by(DepositIndexOutbox.id).all()
+    records = [deposit.fetch_published()[1] for deposit in deposits]
+    assert {e.record_id for e in entries} == \
+        {r.id for r in deposits + records}
+    assert {e.record_class for e in entries} == {
+        None, 'invenio_records_files.api:Record'}
+    current_search.flush_and_refresh('deposits')
+    assert 'draft' == DepositSearch().get_record(
+        str(deposits[0].id)).execute()[0]['_deposit']['status']
+
+    assert (4, 0) == Deposit.indexer.process_outbox(Deposit)
+    current_search.flush_and_refresh('deposits')
+    assert 'published' == DepositSearch().get_record(
+        str(deposits[0].id)).execute()[0]['_deposit']['status']
+
+
+def test_deferred_indexing(app, fake_schemas, location):
+    """Test indexing deferred until the session commit."""
+    def indexed_title(deposit):
+        current_search.flush_and_refresh('deposits')
+        hits = DepositSearch().get_record(str(deposit.id)).execute()
+        return hits[0].title if hits else None
+
+    current_app.config['DEPOSIT_DEFERRED_INDEXING'] = True
+    deposit = Deposit.create({'title': 'first'})
+    deposit['title'] = 'second'
+    deposit.commit()
+    assert indexed_title(deposit) is None
+
+    db.session.commit()
+    assert 'second' == indexed_title(deposit)
+
+    deposit['title'] = 'rolled back'
+    deposit.commit()
+    db.session.rollback()
+    db.session.commit()
+    assert 'second' == indexed_title(deposit)
+
+    deposit = Deposit.get_record(deposit.id)
+    deposit.delete()
+    db.session.commit()
+    assert indexed_title(deposit) is None
+
+
+def test_indexing_outbox(app, fake_schemas, location):
+    """Test indexing through the outbox."""
+    current_app.config['DEPOSIT_INDEXING_OUTBOX'] = True
+    deposit = Deposit.create({'title': 'outbox'})
+    deposit.commit()
+    deleted = Deposit.create({'title': 'deleted'})
+    db.session.commit()
+    assert 2 == DepositIndexOutbox.query.count()
+
+    deleted = Deposit.get_record(deleted.id)
+    deleted.delete()
+    db.session.commit()
+    assert 3 == DepositIndexOutbox.query.count()
+
+    assert (2, 0) == Deposit.indexer.process_outbox(Deposit)
+    assert 0 == DepositIndexOutbox.query.count()
+    current_search.flush_and_refresh('deposits')
+    assert 1 == DepositSearch().get_record(str(deposit.id)).count()
+    assert 0 == DepositSearch().get_record(str(deleted.id)).count()
+
+
+def test_routing_by_creator(app, fake_schemas, location, users):
+    """Test the deposits routed to the shard of their creator."""
+    user_id = users[0]['id']
+    datastore = app.extensions['security'].datastore
+
+    def routed(routing):
+        current_search.flush_and_refresh('deposits')
+        return current_search_client.count(index='deposits', body={
+            'query': {'term': {'_routing': routing}},
+        })['count']
+
+    with app.test_request_context():
+        current_app.config['DEPOSIT_ROUTING_BY_CREATOR'] = True
+        user = datastore.find_user(email=users[0]['email'])
+        login_user(user)
+        identity_changed.send(current_app._get_current_object(),
+                              identity=Identity(user.id))
+        deposit = Deposit.create({'title': 'routed'})
+        deposit.commit()
+        db.session.commit()
+        assert str(user_id) == deposit.index_routing
+        assert 1 == routed(str(user_id))
+
+        search = DepositSearch()
+        assert str(user_id) == search._params['routing']
+        assert {'term': {'_deposit.owners': user_id}} in \
+            search.to_dict()['query']['bool']['filter']
+        assert 1 == search.get_record(str(deposit.id)).count()
+
+        current_app.config['DEPOSIT_INDEXING_OUTBOX'] = True
+        deposit = Deposit.get_record(deposit.id)
+        deposit.delete()
+        db.session.commit()
+        assert str(user_id) == DepositIndexOutbox.query.one().routing
+        assert (1, 0) == Deposit.indexer.process_outbox(Deposit)
+        assert 0 == routed(str(user_id))
+
+
+def test_partial_indexing(app, fake_schemas, location):
+    """Test the partial index updates of the deposit actions."""
+    def indexed(deposit):
+        current_search.flush_and_refresh('deposits')
+        return DepositSearch().get_record(str(deposit.id)).execute()[0]
+
+    def mark(deposit):
+        # keep the version, i.e. the revision of the deposit
+        hit = indexed(deposit)
+        current_search_client.index(
+            index=hit.meta.index, id=hit.meta.id,
+            body=dict(hit.to_dict(), marker=True),
+            version=deposit.revision_id, version_type='external_gte')
+
+    current_app.config['DEPOSIT_PARTIAL_INDEXING_FIELDS'] = [
+        '_deposit', '$schema', '_bucket']
+    deposit = Deposit.create({'title': 'first'})
+    deposit.publish()
+    db.session.commit()
+    # the first publishing adds the record PID: fully reindexed
+    assert {'_deposit', 'control_number'} == deposit.changed_fields
+    mark(deposit)
+
+    deposit = deposit.edit()
+    db.session.commit()
+    assert {'_bucket', '_deposit'} == deposit.changed_fields
+    hit = indexed(deposit)
+    assert 'draft' == hit['_deposit']['status']
+    assert hit['marker']
+
+    deposit.publish()
+    db.session.commit()
+    hit = indexed(deposit)
+    assert 'published' == hit['_deposit']['status']
+    assert hit['marker']
+
+    # an older revision is not applied over the indexed one
+    revision = deposit.revisions[deposit.revision_id - 2]
+    stale = Deposit(revision, model=revision.model)
+    assert 'draft' == stale['_deposit']['status']
+    stale.changed_fields = {'_deposit'}
+    with pytest.raises(ConflictError):
+        Deposit.indexer.index(stale)
+    hit = indexed(deposit)
+    assert 'published' == hit['_deposit']['status']
+    assert hit['marker']
+
+    deposit = deposit.edit()
+    deposit['title'] = 'second'
+    deposit.commit()
+    db.session.commit()
+    hit = indexed(deposit)
+    assert 'second' == hit['title']
+    assert 'marker' not in hit
+
+
+def test_partial_indexing_fallback(app, fake_schemas, location, monkeypatch):
+    """Test the full reindexing when the partial update fails."""
+    def indexed(deposit):
+        current_search.flush_and_refresh('deposits')
+        return DepositSearch().get_record(str(deposit.id)).execute()[0]
+
+    current_app.config['DEPOSIT_PARTIAL_INDEXING_FIELDS'] = [
+        '_deposit', '$schema', '_bucket']
+    deposit = Deposit.create({'title': 'first'})
+    deposit.publish()
+    db.session.commit()
+    hit = indexed(deposit)
+    current_search_client.index(
+        index=hit.meta.index, id=hit.meta.id,
+        body=dict(hit.to_dict(), marker=True),
+        version=deposit.revision_id, version_type='external_gte')
+
+    # e.g. a cluster without painless
+    monkeypatch.setattr(
+        'invenio_deposit.indexer._PARTIAL_UPDATE_SCRIPT', 'invalid(')
+    deposit = deposit.edit()
+    db.session.commit()
+    assert {'_bucket', '_deposit'} == deposit.changed_fields
+    hit = indexed(deposit)
+    assert 'draft' == hit['_deposit']['status']
+    assert 'marker' not in hit
@@ -11,6 +11,7 @@
 
 from __future__ import absolute_import, print_function
 
+import json
 from copy import deepcopy
 
 import pytest
@@ -19,7 +20,10 @@ from invenio_records_rest import InvenioRecordsREST
 from invenio_records_rest.utils import PIDConverter
 
 from invenio_deposit import InvenioDeposit, InvenioDepositREST, bundles
+from invenio_deposit.api import Deposit
 from invenio_deposit.proxies import current_deposit
+from invenio_deposit.serializers import json_dumps
+from invenio_deposit.utils import mark_as_action
 
 
 def _check_template():
@@ -82,6 +86,71 @@ def test_init():
         current_deposit.app
 
 
+def test_actions_registry():
+    """Test the registry of the deposit actions."""
+    class CustomDeposit(Deposit):
+        @mark_as_action
+        def clone(self, pid=None):
+            pass
+
+        def publish(self, pid=None):
+            pass
+
+    app = Flask('testapp')
+    app.url_map.converters['pid'] = PIDConverter
+    InvenioDeposit(app)
+
+    with app.app_context():
+        actions = current_deposit.actions[Deposit]
+        assert set(actions) == {'discard', 'edit', 'publish'}
+        # the actions are extracted once per class
+        assert current_deposit.actions[Deposit] is actions
+        assert set(current_deposit.actions[CustomDeposit]) == {
+            'clone', 'discard', 'edit'}
+        assert current_deposit.actions[Deposit] is actions
+
+
+JSON_DATA = {
+    '_deposit': {'id': '1', 'status': 'draft', 'owners': [1]},
+    'title': u'Caf\xe9 \u2013 \U0001f600',
+    '_files': [{
+        'key': 'file-{0}.txt'.format(i),
+        'size': i,
+        'checksum': 'md5:{0:032x}'.format(i),
+        'url': 'http://localhost/api/files/{0}'.format(i),
+        'ratio': i / 7.0,
+    } for i in range(1000)],
+}
+
+
+def test_json_encoder():
+    """Test the default JSON encoder of the deposit serializers."""
+    app = Flask('testapp')
+    InvenioDeposit(app)
+    with app.app_context():
+        assert json_dumps(JSON_DATA) == json.dumps(JSON_DATA)
+
+
+@pytest.mark.parametrize('package,ensure_ascii', [
+    ('ujson', True),
+    ('orjson', False),
+])
+def test_fast_json_encoders(package, ensure_ascii):
+    """Test the optional JSON encoders of the deposit serializers."""
+    pytest.importorskip(package)
+    app = Flask('testapp')
+    app.config['DEPOSIT_JSON_ENCODER'] = \
+        'invenio_deposit.serializers:{0}_dumps'.format(package)
+    InvenioDeposit(app)
+    with app.app_context():
+        encoded = json_dumps(JSON_DATA)
+    if isinstance(encoded, bytes):
+        encoded = encoded.decode('utf-8')
+    # the output of the encoders differ only in whitespaces
+    assert encoded == json.dumps(
+        JSON_DATA, separators=(',', ':'), ensure_ascii=ensure_ascii)
+
+
 def test_conflict_in_endpoint_prefixes():
     """Test conflict in endpoint prefixes."""
     app = Flask('testapp')
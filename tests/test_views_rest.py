@@ -12,6 +12,7 @@
 from __future__ import absolute_import, print_function
 
 import json
+import re
 from time import sleep
 
 import pytest
@@ -19,10 +20,16 @@ from flask import url_for
 from flask_security import url_for_security
 from invenio_accounts.testutils import login_user_via_view
 from invenio_db import db
+from invenio_pidstore.models import PersistentIdentifier
 from invenio_search import current_search
 from six import BytesIO
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 from invenio_deposit.api import Deposit
+from invenio_deposit.cache import MemoryResponseCache
+from invenio_deposit.links import deposit_links_factory
+from invenio_deposit.signals import post_action
 
 
 def test_publish_merge_conflict(api, es, users, location, deposit,
@@ -97,6 +104,33 @@ def test_edit_deposit_users(api, es, users, location, deposit,
             assert res.status_code == status
 
 
+@pytest.mark.parametrize('check_elasticsearch,status', [
+    (False, 200),
+    (True, 403),
+])
+def test_edit_deposit_not_indexed(api, es, users, location, deposit,
+                                  json_headers, check_elasticsearch, status):
+    """Test edit by the owner of a deposit missing from the index."""
+    api.config['DEPOSIT_PERMISSION_CHECK_ELASTICSEARCH'] = \
+        check_elasticsearch
+    Deposit.indexer.delete(deposit)
+    current_search.flush_and_refresh('_all')
+    deposit_id = deposit['_deposit']['id']
+    with api.test_request_context():
+        with api.test_client() as client:
+            client.post(url_for_security('login'), data=dict(
+                email=users[0]['email'],
+                password='tester'
+            ))
+            res = client.put(
+                url_for('invenio_deposit_rest.depid_item',
+                        pid_value=deposit_id),
+                data=json.dumps({"title": "bar"}),
+                headers=json_headers
+            )
+            assert res.status_code == status
+
+
 def test_edit_deposit_by_good_oauth2_token(api, es, users, location,
                                            deposit, write_token_user_1,
                                            oauth2_headers_user_1):
@@ -179,6 +213,315 @@ def test_links_html_link_missing(api, es, location, fake_schemas,
             assert 'html' not in links
 
 
+def test_links_factory(api, es, location, fake_schemas, users, json_headers):
+    """Test the links filled in the compiled templates."""
+    api.config['DEPOSIT_UI_ENDPOINT'] = '{scheme}://{host}/deposit/{pid_value}'
+    with api.test_request_context():
+        with api.test_client() as client:
+            login_user_via_view(client, users[0]['email'], 'tester')
+            res = client.post(url_for('invenio_deposit_rest.depid_list'),
+                              data=json.dumps({}), headers=json_headers)
+            assert res.status_code == 201
+            links = json.loads(res.data.decode('utf-8'))['links']
+            pid_value = json.loads(res.data.decode('utf-8'))['id']
+            assert links['self'] == url_for(
+                'invenio_deposit_rest.depid_item', pid_value=pid_value,
+                _external=True)
+
+    pid = PersistentIdentifier(pid_type='depid', pid_value=u'a b/\xfc:%?')
+    with api.test_request_context('/deposits/'):
+        def _url(name, **kwargs):
+            return url_for('invenio_deposit_rest.depid_{0}'.format(name),
+                           pid_value=pid.pid_value, _external=True, **kwargs)
+
+        expected = {
+            'self': _url('item'),
+            'files': _url('files'),
+            'html': u'http://localhost/deposit/a b/\xfc:%?',
+            'discard': _url('actions', action='discard'),
+            'edit': _url('actions', action='edit'),
+            'publish': _url('actions', action='publish'),
+        }
+        assert deposit_links_factory(pid) == expected
+        # the second time the links are filled in the compiled templates
+        assert deposit_links_factory(pid) == expected
+
+    with api.test_request_context('/deposits/',
+                                  base_url='https://example.org'):
+        assert deposit_links_factory(pid)['self'] == url_for(
+            'invenio_deposit_rest.depid_item', pid_value=pid.pid_value,
+            _external=True)
+
+
+def test_links_factory_without_rest_state(api, monkeypatch):
+    """Test the deposit links with the state of the UI extension only."""
+    # the endpoint prefixes are registered before the first request
+    api.test_client().get('/')
+    state = api.extensions['invenio-deposit-rest']
+    monkeypatch.delitem(api.extensions, 'invenio-deposit-rest')
+    monkeypatch.setitem(api.extensions, 'invenio-deposit', state)
+    pid = PersistentIdentifier(pid_type='depid', pid_value='1')
+    with api.test_request_context('/deposits/'):
+        links = deposit_links_factory(pid)
+        assert links['self'] == url_for(
+            'invenio_deposit_rest.depid_item', pid_value='1', _external=True)
+        assert deposit_links_factory(pid) == links
+    assert state.link_templates
+
+
+def test_list_cursor(api, es, location, fake_schemas, users, json_headers):
+    """Test the cursor pagination of the deposits."""
+    with api.test_request_context():
+        with api.test_client() as client:
+            login_user_via_view(client, users[0]['email'], 'tester')
+            created = set()
+            for i in range(5):
+                res = client.post(url_for('invenio_deposit_rest.depid_list'),
+                                  data=json.dumps({}), headers=json_headers)
+                assert res.status_code == 201
+                created.add(json.loads(res.data.decode('utf-8'))['id'])
+            current_search.flush_and_refresh('_all')
+
+            url = url_for('invenio_deposit_rest.depid_list', cursor='',
+                          size=2)
+            pages = []
+            while url:
+                res = client.get(url)
+                assert res.status_code == 200
+                data = json.loads(res.data.decode('utf-8'))
+                assert 'prev' not in data['links']
+                pages.append([hit['id'] for hit in data['hits']['hits']])
+                url = data['links'].get('next')
+            assert [len(page) for page in pages] == [2, 2, 1]
+            assert set(sum(pages, [])) == created
+
+            for cursor in ('invalid', 'e30'):
+                res = client.get(url_for('invenio_deposit_rest.depid_list',
+                                         cursor=cursor))
+                assert res.status_code == 400
+            res = client.get(url_for('invenio_deposit_rest.depid_list',
+                                     cursor='', page=2))
+            assert res.status_code == 400
+
+
+def test_list_listing_serializer(api, es, location, fake_schemas, users,
+                                 json_headers):
+    """Test the listing of the deposits with the slim serializer."""
+    api.config['REST_MIMETYPE_QUERY_ARG_NAME'] = 'format'
+    listing = 'application/vnd.invenio.deposit-listing+json'
+    with api.test_request_context():
+        with api.test_client() as client:
+            login_user_via_view(client, users[0]['email'], 'tester')
+            res = client.post(url_for('invenio_deposit_rest.depid_list'),
+                              data=json.dumps({'title': 'Title',
+                                               'description': 'Text'}),
+                              headers=json_headers)
+            assert res.status_code == 201
+            pid_value = json.loads(res.data.decode('utf-8'))['id']
+            current_search.flush_and_refresh('_all')
+
+            for url, headers in [
+                    (url_for('invenio_deposit_rest.depid_list'),
+                     [('Accept', listing)]),
+                    (url_for('invenio_deposit_rest.depid_list',
+                             format='listing'), []),
+                    (url_for('invenio_deposit_rest.depid_list',
+                             format='listing', cursor=''), [])]:
+                res = client.get(url, headers=headers)
+                assert res.status_code == 200
+                assert res.content_type == listing
+                hit, = json.loads(res.data.decode('utf-8'))['hits']['hits']
+                assert hit['id'] == pid_value
+                assert set(hit['metadata']) == {'_deposit', 'title'}
+                assert hit['metadata']['_deposit']['id'] == pid_value
+                assert hit['created'] and hit['updated']
+                assert hit['links']['self'] == url_for(
+                    'invenio_deposit_rest.depid_item', pid_value=pid_value,
+                    _external=True)
+
+            res = client.get(url_for('invenio_deposit_rest.depid_list'))
+            assert res.content_type == 'application/json'
+            hit, = json.loads(res.data.decode('utf-8'))['hits']['hits']
+            assert hit['metadata']['description'] == 'Text'
+
+
+def test_fields_projection(api, es, location, fake_schemas, users,
+                           json_headers):
+    """Test the projection of the deposits on the requested fields."""
+    with api.test_request_context():
+        with api.test_client() as client:
+            login_user_via_view(client, users[0]['email'], 'tester')
+            res = client.post(url_for('invenio_deposit_rest.depid_list'),
+                              data=json.dumps({'title': 'Title',
+                                               'description': 'Text'}),
+                              headers=json_headers)
+            assert res.status_code == 201
+            data = json.loads(res.data.decode('utf-8'))
+            pid_value = data['id']
+            res = client.post(
+                data['links']['files'],
+                data={'file': (BytesIO(b'test'), 'test.txt'),
+                      'name': 'test.txt'},
+                content_type='multipart/form-data',
+            )
+            assert res.status_code == 201
+            current_search.flush_and_refresh('_all')
+
+            url = url_for('invenio_deposit_rest.depid_item',
+                          pid_value=pid_value)
+            res = client.get(url, query_string='fields=_deposit.status,title')
+            assert res.status_code == 200
+            data = json.loads(res.data.decode('utf-8'))
+            assert data['metadata'] == {
+                '_deposit': {'status': 'draft'}, 'title': 'Title'}
+            assert data['id'] == pid_value
+            assert 'self' in data['links']
+            res = client.get(url, query_string='fields=_files.key')
+            assert json.loads(res.data.decode('utf-8'))['metadata'] == {
+                '_files': [{'key': 'test.txt'}]}
+            res = client.get(url)
+            assert 'description' in json.loads(
+                res.data.decode('utf-8'))['metadata']
+
+            for query_string in ('fields=title', 'fields=title&cursor='):
+                res = client.get(url_for('invenio_deposit_rest.depid_list'),
+                                 query_string=query_string)
+                assert res.status_code == 200
+                hit, = json.loads(res.data.decode('utf-8'))['hits']['hits']
+                assert hit['id'] == pid_value
+                assert set(hit['metadata']) == {'_deposit', 'title'}
+
+
+def test_deposit_etag(api, es, location, fake_schemas, users, json_headers):
+    """Test the conditional requests on a deposit."""
+    with api.test_request_context():
+        with api.test_client() as client:
+            login_user_via_view(client, users[0]['email'], 'tester')
+            res = client.post(url_for('invenio_deposit_rest.depid_list'),
+                              data=json.dumps({'title': 'Title'}),
+                              headers=json_headers)
+            assert res.status_code == 201
+            links = json.loads(res.data.decode('utf-8'))['links']
+
+            res = client.get(links['self'])
+            assert res.status_code == 200
+            assert 'Accept' in res.headers['Vary']
+            etag = res.headers['ETag']
+            res = client.get(links['self'],
+                             headers=[('If-None-Match', etag)])
+            assert res.status_code == 304
+            assert res.headers['ETag'] == etag
+            assert not res.data
+
+            # the projected deposits have their own ETag
+            res = client.get(links['self'], query_string='fields=title',
+                             headers=[('If-None-Match', etag)])
+            assert res.status_code == 200
+            fields_etag = res.headers['ETag']
+            assert fields_etag != etag
+            res = client.get(links['self'], query_string='fields=title',
+                             headers=[('If-None-Match', fields_etag)])
+            assert res.status_code == 304
+
+            # the files are part of the deposit state
+            res = client.post(
+                links['files'],
+                data={'file': (BytesIO(b'test'), 'test.txt'),
+                      'name': 'test.txt'},
+                content_type='multipart/form-data',
+            )
+            assert res.status_code == 201
+            res = client.get(links['self'],
+                             headers=[('If-None-Match', etag)])
+            assert res.status_code == 200
+            data = json.loads(res.data.decode('utf-8'))
+            assert data['metadata']['_files'][0]['key'] == 'test.txt'
+            assert res.headers['ETag'] != etag
+
+            # updates accept the ETag of the last read
+            metadata = data['metadata']
+            metadata['title'] = 'New title'
+            res = client.put(links['self'], data=json.dumps(metadata),
+                             headers=json_headers + [('If-Match', etag)])
+            assert res.status_code == 412
+            res = client.get(links['self'], query_string='fields=title')
+            etag = res.headers['ETag']
+            res = client.put(links['self'], data=json.dumps(metadata),
+                             headers=json_headers + [('If-Match', etag)])
+            assert res.status_code == 200
+            assert res.headers['ETag'] != etag
+            res = client.get(links['self'], headers=[
+                ('If-None-Match', res.headers['ETag'])])
+            assert res.status_code == 304
+
+
+def test_response_cache(api, es, location, fake_schemas, users,
+                        json_headers):
+    """Test the cache of the deposit responses."""
+    api.config['DEPOSIT_RESPONSE_CACHE'] = \
+        'invenio_deposit.cache:memory_response_cache_factory'
+    cache = api.extensions['invenio-deposit-rest'].response_cache
+    with api.test_request_context():
+        with api.test_client() as client:
+            login_user_via_view(client, users[0]['email'], 'tester')
+            res = client.post(url_for('invenio_deposit_rest.depid_list'),
+                              data=json.dumps({'title': 'Title'}),
+                              headers=json_headers)
+            assert res.status_code == 201
+            data = json.loads(res.data.decode('utf-8'))
+            links = data['links']
+            deposit_id = Deposit.get_record(PersistentIdentifier.get(
+                'depid', data['id']).object_uuid).id
+
+            res = client.get(links['self'])
+            assert res.status_code == 200
+            assert len(cache._entries) == 1
+            cached = client.get(links['self'])
+            assert cached.data == res.data
+            assert cached.headers['ETag'] == res.headers['ETag']
+            assert cached.headers['Link'] == res.headers['Link']
+            assert cached.content_type == res.content_type
+            # the responses differ with the query parameters
+            res = client.get(links['self'], query_string='fields=title')
+            assert json.loads(res.data.decode('utf-8'))['metadata'] == {
+                'title': 'Title'}
+            assert len(cache._entries) == 2
+            assert len(cache._keys[str(deposit_id)]) == 2
+
+            # the responses are dropped when the deposit changes
+            res = client.post(
+                links['files'],
+                data={'file': (BytesIO(b'test'), 'test.txt'),
+                      'name': 'test.txt'},
+                content_type='multipart/form-data',
+            )
+            assert res.status_code == 201
+            assert not cache._entries
+            res = client.get(links['self'])
+            assert json.loads(res.data.decode('utf-8'))['metadata'][
+                '_files'][0]['key'] == 'test.txt'
+
+            # the responses of other users are not served to anonymous users
+            with api.test_client() as anonymous:
+                res = anonymous.get(links['self'])
+                assert res.status_code == 401
+
+
+def test_memory_response_cache():
+    """Test the eviction of the least recently used responses."""
+    cache = MemoryResponseCache(maxsize=2)
+    cache.set('1', 'a', b'1a')
+    cache.set('2', 'a', b'2a')
+    assert cache.get('1', 'a') == b'1a'
+    cache.set('2', 'b', b'2b')
+    assert cache.get('2', 'a') is None
+    assert cache.get('1', 'a') == b'1a'
+    assert cache.get('2', 'b') == b'2b'
+    cache.delete('2')
+    assert cache.get('2', 'b') is None
+    assert cache.get('1', 'a') == b'1a'
+
+
 def test_delete_deposit_by_good_oauth2_token(api, es, users, location,
                                              deposit, write_token_user_1,
                                              oauth2_headers_user_1):
@@ -584,3 +927,120 @@ def test_simple_rest_flow(api, es, location, fake_schemas, users,
             assert res.status_code == 200
             data = json.loads(res.data.decode('utf-8'))
             assert 'Revision 2' == data['metadata']['title']
+
+
+def test_async_actions(api, es, users, location, deposit, fake_schemas):
+    """Test deposit actions run asynchronously."""
+    api.config['DEPOSIT_ASYNC_ACTIONS'] = ['publish', 'discard']
+    deposit_id = deposit['_deposit']['id']
+    with api.test_request_context():
+        with api.test_client() as client:
+            client.post(url_for_security('login'), data=dict(
+                email=users[0]['email'],
+                password='tester'
+            ))
+            # a draft never published can not be discarded
+            res = client.post(
+                url_for('invenio_deposit_rest.depid_actions',
+                        pid_value=deposit_id, action='discard'),
+            )
+            assert res.status_code == 202
+            res = client.get(res.headers['Location'])
+            assert res.status_code == 200
+            data = json.loads(res.data.decode('utf-8'))
+            assert data['action'] == 'discard'
+            assert data['status'] == 'failed'
+            assert data['error']
+
+            res = client.post(
+                url_for('invenio_deposit_rest.depid_actions',
+                        pid_value=deposit_id, action='publish'),
+            )
+            assert res.status_code == 202
+            data = json.loads(res.data.decode('utf-8'))
+            assert data['links']['self'] == res.headers['Location']
+            res = client.get(res.headers['Location'])
+            assert res.status_code == 200
+            data = json.loads(res.data.decode('utf-8'))
+            assert data['status'] == 'succeeded'
+            assert data['error'] is None
+            assert data['created'] <= data['started'] <= data['finished']
+
+            deposit = Deposit.get_record(deposit.id)
+            assert deposit.status == 'published'
+
+            res = client.get(url_for(
+                'invenio_deposit_rest.depid_job', pid_value=deposit_id,
+                job_id='00000000-0000-0000-0000-000000000000'))
+            assert res.status_code == 404
+
+
+def test_async_action_failed_receiver(api, es, users, location, deposit,
+                                      fake_schemas):
+    """Test an async action whose post action receiver raises."""
+    api.config['DEPOSIT_ASYNC_ACTIONS'] = ['publish']
+    deposit_id = deposit['_deposit']['id']
+
+    def receiver(sender, action=None, pid=None, deposit=None):
+        raise RuntimeError()
+
+    with api.test_request_context():
+        with api.test_client() as client:
+            client.post(url_for_security('login'), data=dict(
+                email=users[0]['email'],
+                password='tester'
+            ))
+            with post_action.connected_to(receiver):
+                res = client.post(
+                    url_for('invenio_deposit_rest.depid_actions',
+                            pid_value=deposit_id, action='publish'),
+                )
+            assert res.status_code == 202
+            res = client.get(res.headers['Location'])
+            assert res.status_code == 200
+            data = json.loads(res.data.decode('utf-8'))
+            assert data['status'] == 'failed'
+            assert data['error'] == 'RuntimeError'
+            assert data['finished']
+
+            # the action itself was committed
+            deposit = Deposit.get_record(deposit.id)
+            assert deposit.status == 'published'
+
+
+def test_action_queries(api, es, users, location, deposit, fake_schemas):
+    """Test the PIDs and records loaded by each action."""
+    deposit_id = deposit['_deposit']['id']
+    tables = re.compile(r'SELECT .*\sFROM (pidstore_pid|records_metadata)\b',
+                        re.DOTALL)
+    queries = []
+
+    def count_queries(conn, cursor, statement, *args):
+        match = tables.match(statement)
+        if match:
+            queries.append(match.group(1))
+
+    with api.test_request_context():
+        with api.test_client() as client:
+            client.post(url_for_security('login'), data=dict(
+                email=users[0]['email'],
+                password='tester'
+            ))
+            event.listen(Engine, 'before_cursor_execute', count_queries)
+            try:
+                for action, pids, records in [
+                        ('publish', 1, 2),
+                        ('edit', 2, 2),
+                        ('publish', 2, 3),
+                        ('edit', 2, 2),
+                        ('discard', 2, 2)]:
+                    del queries[:]
+                    res = client.post(
+                        url_for('invenio_deposit_rest.depid_actions',
+                                pid_value=deposit_id, action=action),
+                    )
+                    assert res.status_code in (201, 202)
+                    assert queries.count('pidstore_pid') == pids
+                    assert queries.count('records_metadata') == records
+            finally:
+                event.remove(Engine, 'before_cursor_execute', count_queries)
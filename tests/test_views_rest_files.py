@@ -12,11 +12,17 @@ from __future__ import absolute_import, print_function
 
 import hashlib
 import json
+import re
+import tarfile
+import zipfile
 
 from flask import url_for
 from flask_security import login_user, url_for_security
+from invenio_accounts.testutils import login_user_via_view
 from invenio_db import db
 from six import BytesIO
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 from invenio_deposit.api import Deposit
 
@@ -79,6 +85,74 @@ def test_files_get(api, deposit, files, users):
             assert res.status_code == 403
 
 
+def test_files_get_pages(api, deposit, users):
+    """Test the pagination and the ETag of the files list."""
+    keys = ['file-{0}.txt'.format(i) for i in range(5)]
+    for key in keys:
+        deposit.files[key] = BytesIO(b'test')
+    deposit.commit()
+    db.session.commit()
+
+    with api.test_request_context():
+        with api.test_client() as client:
+            login_user_via_view(client, users[0]['email'], 'tester')
+            url = url_for('invenio_deposit_rest.depid_files',
+                          pid_value=deposit['_deposit']['id'])
+
+            pages = []
+            next_url = url_for('invenio_deposit_rest.depid_files',
+                               pid_value=deposit['_deposit']['id'], limit=2)
+            while next_url:
+                res = client.get(next_url)
+                assert res.status_code == 200
+                pages.append([f['filename'] for f in json.loads(
+                    res.data.decode('utf-8'))])
+                next_url = re.search(r'<([^>]+)>; rel="next"',
+                                     res.headers['Link'])
+                next_url = next_url and next_url.group(1)
+            assert pages == [keys[:2], keys[2:4], keys[4:]]
+
+            res = client.get(url, query_string='limit=2&cursor=invalid')
+            assert res.status_code == 400
+
+            # the listing is not sent again if nothing changed
+            res = client.get(url)
+            etag = res.headers['ETag']
+            res = client.get(url, headers=[('If-None-Match', etag)])
+            assert res.status_code == 304
+            assert res.headers['ETag'] == etag
+
+            # the ETag changes with the files and with their order
+            res = client.delete(url_for(
+                'invenio_deposit_rest.depid_file',
+                pid_value=deposit['_deposit']['id'], key=keys[0]))
+            assert res.status_code == 204
+            res = client.get(url, headers=[('If-None-Match', etag)])
+            assert res.status_code == 200
+            assert len(json.loads(res.data.decode('utf-8'))) == 4
+            etag = res.headers['ETag']
+            res = client.put(url, data=json.dumps(
+                [{'id': key} for key in reversed(keys[1:])]))
+            assert res.status_code == 200
+            res = client.get(url, headers=[('If-None-Match', etag)])
+            assert res.status_code == 200
+            assert [f['filename'] for f in json.loads(
+                res.data.decode('utf-8'))] == keys[:0:-1]
+
+            # the pages list the files by key, also once a listed file is
+            # deleted
+            res = client.get(url, query_string='limit=2')
+            assert [f['filename'] for f in json.loads(
+                res.data.decode('utf-8'))] == keys[1:3]
+            next_url = re.search(r'<([^>]+)>; rel="next"',
+                                 res.headers['Link']).group(1)
+            res = client.delete(url + '/' + keys[2])
+            assert res.status_code == 204
+            res = client.get(next_url)
+            assert [f['filename'] for f in json.loads(
+                res.data.decode('utf-8'))] == keys[3:]
+
+
 def test_files_get_oauth2(api, deposit, users, write_token_user_1,
                           oauth2_headers_user_1, files):
     """Test rest files get a deposit with oauth2."""
@@ -212,6 +286,48 @@ def test_files_post(api, deposit, users):
             assert res.status_code == 403
 
 
+def test_files_post_does_not_commit_deposit(api, deposit, files, users):
+    """Test that uploading a file does not store a new deposit revision."""
+    deposit_id = deposit.id
+    revision_id = deposit.revision_id
+    with api.test_request_context():
+        with api.test_client() as client:
+            client.post(url_for_security('login'), data=dict(
+                email=users[0]['email'],
+                password="tester"
+            ))
+            res = client.post(
+                url_for('invenio_deposit_rest.depid_files',
+                        pid_value=deposit['_deposit']['id']),
+                data={'file': (BytesIO(b'world'), 'world.txt')},
+                content_type='multipart/form-data'
+            )
+            assert res.status_code == 201
+            res = client.delete(
+                url_for('invenio_deposit_rest.depid_file',
+                        pid_value=deposit['_deposit']['id'],
+                        key=files[0].key))
+            assert res.status_code == 204
+
+            db.session.expunge(deposit.model)
+            deposit = Deposit.get_record(deposit_id)
+            assert deposit.revision_id == revision_id
+            assert [f['key'] for f in deposit['_files']] == [files[0].key]
+            # the files are refreshed from the bucket
+            assert [f['key'] for f in deposit.dumps()['_files']] == [
+                'world.txt']
+            res = client.get(
+                url_for('invenio_deposit_rest.depid_item',
+                        pid_value=deposit['_deposit']['id']))
+            data = json.loads(res.data.decode('utf-8'))
+            assert [f['key'] for f in data['metadata']['_files']] == [
+                'world.txt']
+            # committing the deposit stores them
+            deposit.commit()
+            db.session.commit()
+            assert [f['key'] for f in deposit['_files']] == ['world.txt']
+
+
 def test_files_put_oauth2(api, deposit, files, users,
                           write_token_user_1):
     """Test put deposit files with oauth2."""
@@ -335,6 +451,44 @@ def test_files_put(api, deposit, files, users):
             assert deposit['_files'][1]['key'] == order[1]
 
 
+def test_files_queries(api, deposit, users):
+    """Test the file instances are loaded with the objects of the files."""
+    for i in range(10):
+        deposit.files['file-{0}.txt'.format(i)] = BytesIO(b'test')
+    deposit.commit()
+    db.session.commit()
+    file_ids = [str(f.file_id) for f in deposit.files]
+    statements = []
+
+    def count_queries(conn, cursor, statement, *args):
+        if re.match(r'SELECT .*\sFROM files_files\b', statement, re.DOTALL):
+            statements.append(statement)
+
+    with api.test_request_context():
+        with api.test_client() as client:
+            login_user_via_view(client, users[0]['email'], 'tester')
+            url = url_for('invenio_deposit_rest.depid_files',
+                          pid_value=deposit['_deposit']['id'])
+            event.listen(Engine, 'before_cursor_execute', count_queries)
+            try:
+                db.session.expire_all()
+                res = client.get(url)
+                assert res.status_code == 200
+                assert [f['id'] for f in json.loads(
+                    res.data.decode('utf-8'))] == file_ids
+                assert statements == []
+
+                db.session.expire_all()
+                res = client.put(url, data=json.dumps(
+                    [{'id': id_} for id_ in reversed(file_ids)]))
+                assert res.status_code == 200
+                assert [f['id'] for f in json.loads(
+                    res.data.decode('utf-8'))] == file_ids[::-1]
+                assert statements == []
+            finally:
+                event.remove(Engine, 'before_cursor_execute', count_queries)
+
+
 def test_file_get(api, deposit, files, users):
     """Test get file."""
     with api.test_request_context():
@@ -578,3 +732,243 @@ def test_file_put(api, deposit, files, users):
             assert data['filename'] == obj.key
             assert data['checksum'] == obj.file.checksum
             assert data['id'] == str(obj.file.id)
+
+
+def test_file_put_uploaded_file(api, deposit, users):
+    """Rename a file uploaded by an earlier request."""
+    with api.test_request_context():
+        with api.test_client() as client:
+            login_user_via_view(client, users[0]['email'], 'tester')
+            res = client.post(
+                url_for('invenio_deposit_rest.depid_files',
+                        pid_value=deposit['_deposit']['id']),
+                data={'file': (BytesIO(b'hello'), 'hello.txt')},
+                content_type='multipart/form-data'
+            )
+            assert res.status_code == 201
+            file_id = json.loads(res.data.decode('utf-8'))['id']
+
+            res = client.put(
+                url_for('invenio_deposit_rest.depid_file',
+                        pid_value=deposit['_deposit']['id'],
+                        key='hello.txt'),
+                data=json.dumps({'filename': 'renamed.txt'}))
+            assert res.status_code == 200
+            data = json.loads(res.data.decode('utf-8'))
+            assert 'renamed.txt' == data['filename']
+            assert file_id == data['id']
+
+            deposit_id = deposit.id
+            db.session.expunge(deposit.model)
+            deposit = Deposit.get_record(deposit_id)
+            assert ['renamed.txt'] == [f.key for f in deposit.files]
+            assert [file_id] == [
+                f['file_id'] for f in deposit.dumps()['_files']]
+
+
+def test_file_chunked_upload(api, deposit, users):
+    """Test a chunked upload of a deposit file."""
+    api.config['FILES_REST_MULTIPART_CHUNKSIZE_MIN'] = 2
+    content = b'0123456789'
+    with api.test_request_context():
+        with api.test_client() as client:
+            client.post(url_for_security('login'), data=dict(
+                email=users[0]['email'],
+                password="tester"
+            ))
+            url = url_for('invenio_deposit_rest.depid_file',
+                          pid_value=deposit['_deposit']['id'],
+                          key='data.bin')
+            # start the upload
+            res = client.post(url + '?uploads&size=10&partSize=4')
+            assert res.status_code == 201
+            data = json.loads(res.data.decode('utf-8'))
+            assert data['last_part_number'] == 2
+            assert data['parts'] == []
+            part_url = url + '?uploadId={0}&partNumber={1}'.format(
+                data['upload_id'], '{0}')
+            upload_url = url + '?uploadId={0}'.format(data['upload_id'])
+
+            # upload the parts, in any order
+            for number in (2, 0):
+                res = client.put(part_url.format(number),
+                                 data=content[number * 4:(number + 1) * 4])
+                assert res.status_code == 200
+            res = client.put(part_url.format(1), data=b'45')
+            assert res.status_code == 400
+
+            # list the parts uploaded so far, to resume the upload
+            res = client.get(upload_url)
+            assert res.status_code == 200
+            data = json.loads(res.data.decode('utf-8'))
+            assert [(p['part_number'], p['start_byte']) for p in
+                    data['parts']] == [(0, 0), (2, 8)]
+            res = client.post(upload_url)
+            assert res.status_code == 400
+
+            # complete it
+            res = client.put(part_url.format(1), data=content[4:8])
+            assert res.status_code == 200
+            res = client.post(upload_url)
+            assert res.status_code == 202
+            data = json.loads(res.data.decode('utf-8'))
+            assert data['filename'] == 'data.bin'
+            assert data['filesize'] == 10
+            assert data['completed']
+            # merged by the task
+            res = client.get(upload_url)
+            assert res.status_code == 404
+
+            deposit = Deposit.get_record(deposit.id)
+            with deposit.files['data.bin'].obj.file.storage().open() as fp:
+                assert fp.read() == content
+
+            # an upload can not replace an existing file
+            res = client.post(url + '?uploads&size=10&partSize=4')
+            assert res.status_code == 400
+
+
+def test_file_chunked_upload_abort(api, deposit, users):
+    """Test aborting a chunked upload of a deposit file."""
+    api.config['FILES_REST_MULTIPART_CHUNKSIZE_MIN'] = 2
+    with api.test_request_context():
+        with api.test_client() as client:
+            client.post(url_for_security('login'), data=dict(
+                email=users[0]['email'],
+                password="tester"
+            ))
+            url = url_for('invenio_deposit_rest.depid_file',
+                          pid_value=deposit['_deposit']['id'],
+                          key='data.bin')
+            res = client.post(url + '?uploads&size=10')
+            assert res.status_code == 400
+            res = client.post(url + '?uploads&size=10&partSize=4')
+            data = json.loads(res.data.decode('utf-8'))
+            upload_url = url + '?uploadId={0}'.format(data['upload_id'])
+            res = client.put(upload_url + '&partNumber=0', data=b'0123')
+            assert res.status_code == 200
+
+            res = client.delete(upload_url)
+            assert res.status_code == 204
+            res = client.get(upload_url)
+            assert res.status_code == 404
+            assert len(Deposit.get_record(deposit.id).files) == 0
+
+
+def test_files_batch_upload(api, deposit, files, users):
+    """Test uploading many deposit files at once."""
+    with api.test_request_context():
+        with api.test_client() as client:
+            client.post(url_for_security('login'), data=dict(
+                email=users[0]['email'],
+                password="tester"
+            ))
+            url = url_for('invenio_deposit_rest.depid_files',
+                          pid_value=deposit['_deposit']['id']) + '?batch'
+            res = client.post(url, data={'file': [
+                (BytesIO(b'a'), 'a.txt'),
+                (BytesIO(b'b'), 'b.txt'),
+                (BytesIO(b'again'), files[0].key),
+            ]}, content_type='multipart/form-data')
+            assert res.status_code == 201
+            data = json.loads(res.data.decode('utf-8'))
+            assert [(f['filename'], f.get('filesize'), f.get('status'))
+                    for f in data] == [
+                ('a.txt', 1, None),
+                ('b.txt', 1, None),
+                (files[0].key, None, 400),
+            ]
+
+            archive = BytesIO()
+            with tarfile.open(fileobj=archive, mode='w:gz') as tar:
+                for name, content in (('dir/c.txt', b'c'), ('a.txt', b'a')):
+                    info = tarfile.TarInfo(name)
+                    info.size = len(content)
+                    tar.addfile(info, BytesIO(content))
+            res = client.post(url, data=archive.getvalue(),
+                              content_type='application/gzip')
+            assert res.status_code == 201
+            data = json.loads(res.data.decode('utf-8'))
+            assert [(f['filename'], f.get('status')) for f in data] == [
+                ('dir_c.txt', None), ('a.txt', 400)]
+
+            archive = BytesIO()
+            with zipfile.ZipFile(archive, mode='w') as zip_:
+                zip_.writestr('a.txt', b'a')
+            res = client.post(url, data=archive.getvalue(),
+                              content_type='application/zip')
+            assert res.status_code == 400
+
+            res = client.post(url, data=b'not a zip',
+                              content_type='application/zip')
+            assert res.status_code == 400
+
+            deposit = Deposit.get_record(deposit.id)
+            assert sorted(f['key'] for f in deposit.dumps()['_files']) == [
+                'a.txt', 'b.txt', 'dir_c.txt', files[0].key]
+
+
+def test_files_patch(api, deposit, files, users):
+    """Test renaming and deleting many deposit files at once."""
+    for key in ('a.txt', 'b.txt'):
+        deposit.files[key] = BytesIO(b'content')
+    deposit.commit()
+    db.session.commit()
+    deposit_id = deposit.id
+    revision_id = deposit.revision_id
+    with api.test_request_context():
+        with api.test_client() as client:
+            client.post(url_for_security('login'), data=dict(
+                email=users[0]['email'],
+                password="tester"
+            ))
+            url = url_for('invenio_deposit_rest.depid_files',
+                          pid_value=deposit['_deposit']['id'])
+
+            # nothing is applied if an operation fails
+            res = client.patch(url, data=json.dumps([
+                {'op': 'delete', 'filename': 'a.txt'},
+                {'op': 'rename', 'filename': 'b.txt',
+                 'new_filename': files[0].key},
+            ]))
+            assert res.status_code == 400
+            data = json.loads(res.data.decode('utf-8'))
+            assert data['errors'][0]['field'] == '1'
+            res = client.patch(url, data=json.dumps([
+                {'op': 'copy', 'filename': 'a.txt'},
+            ]))
+            assert res.status_code == 400
+            res = client.patch(url, data=json.dumps([
+                {'op': 'delete', 'filename': 'missing.txt'},
+            ]))
+            assert res.status_code == 400
+            # malformed operations
+            for ops in ([{'op': 'delete', 'filename': ['a.txt']}],
+                        [{'op': 'delete', 'filename': None}],
+                        [{'op': 'rename', 'filename': 'a.txt',
+                          'new_filename': 1}],
+                        [{'op': 'rename', 'filename': 'a.txt'}],
+                        [{'op': ['delete'], 'filename': 'a.txt'}],
+                        [{'op': 'delete', 'filename': 'a.txt'}, 'b.txt']):
+                res = client.patch(url, data=json.dumps(ops))
+                assert res.status_code == 400
+                data = json.loads(res.data.decode('utf-8'))
+                assert data['errors'][0]['field'] == str(len(ops) - 1)
+
+            res = client.patch(url, data=json.dumps([
+                {'op': 'delete', 'filename': files[0].key},
+                {'op': 'rename', 'filename': 'b.txt',
+                 'new_filename': files[0].key},
+                {'op': 'rename', 'filename': 'a.txt',
+                 'new_filename': 'c.txt'},
+            ]))
+            assert res.status_code == 200
+            data = json.loads(res.data.decode('utf-8'))
+            assert sorted(f['filename'] for f in data) == [
+                'c.txt', files[0].key]
+
+            db.session.expunge(deposit.model)
+            deposit = Deposit.get_record(deposit_id)
+            assert deposit.revision_id == revision_id + 1
+            assert sorted(f['key'] for f in deposit['_files']) == [
+                'c.txt', files[0].key]